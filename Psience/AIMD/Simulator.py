@@ -3,6 +3,7 @@ import collections, functools, numpy as np
 from McUtils.Data import AtomData, UnitsData
 from McUtils.Zachary import FiniteDifferenceDerivative, RBFDInterpolator
 import McUtils.Numputils as nput
+import McUtils.Misc as mcmisc
 
 from ..Molecools import Molecule, MolecularZMatrixCoordinateSystem
 from ..Molecools.Properties import PropertyManager
@@ -51,6 +52,10 @@ class AIMDSimulator:
             for _ in range(coords.ndim - 2):
                 self._mass = np.expand_dims(self._mass, 0)
         self.coords = coords
+        # mass invariants used every step
+        self._float_masses = np.asanyarray(self.masses, dtype=float)
+        self._inv_total_mass = 1 / np.sum(self._float_masses)
+        self._inv_2mass = 1 / (2 * self._mass)
         # for _ in range(coordinates.ndim - 2):
         #     self._mass = np.expand_dims(self._mass, -1)
         if isinstance(velocities, (int, float, np.integer, np.floating)):
@@ -73,8 +78,11 @@ class AIMDSimulator:
         self.force_function = force_function
         self._prev_forces = None
 
-        self.trajectory = collections.deque()
-        self.trajectory.append(self.coords)
+        # trajectory frames are written into a preallocated buffer that gets
+        # grown in `propagate` rather than collected and copied out of a deque
+        self._traj_buffer = np.empty((1,) + self.coords.shape, dtype=np.result_type(self.coords, float))
+        self._traj_size = 0
+        self._append_frame(self.coords)
         if track_kinetic_energy:
             self.kinetic_energies = collections.deque()
             self.kinetic_energies.append(
@@ -140,24 +148,67 @@ class AIMDSimulator:
             jacs = np.reshape(np.moveaxis(jacs, 1, 0), (len(coords), ncs, ncs))
             forces = jacs@forces.reshape((len(coords), ncs, 1))
             forces = forces.reshape(coords.shape)
-            # raise Exception(forces.shape)
         else:
             forces = self.force_function(coords)
         return forces
 
+    @staticmethod
+    @mcmisc.njit(cache=True)
+    def _verlet_coordinate_update(coords, vels, forces, masses, inv_total_mass, dt):
+        # fused position update + COM removal for (nstruct, natoms, 3) structures
+        nstruct, natoms, ndim = coords.shape
+        new_coords = np.empty(coords.shape)
+        com = np.empty(ndim)
+        for s in range(nstruct):
+            com[:] = 0.
+            for a in range(natoms):
+                m = masses[a]
+                for x in range(ndim):
+                    c = coords[s, a, x] + vels[s, a, x] * dt + forces[s, a, x] / (2 * m) * dt * dt
+                    new_coords[s, a, x] = c
+                    com[x] += m * c
+            for a in range(natoms):
+                for x in range(ndim):
+                    new_coords[s, a, x] -= com[x] * inv_total_mass # don't let COM move
+        return new_coords
+
+    @staticmethod
+    @mcmisc.njit(cache=True)
+    def _verlet_velocity_update(vels, forces, forces_new, masses, dt):
+        nstruct, natoms, ndim = vels.shape
+        new_vels = np.empty(vels.shape)
+        for s in range(nstruct):
+            for a in range(natoms):
+                scaling = dt / (2 * masses[a])
+                for x in range(ndim):
+                    new_vels[s, a, x] = vels[s, a, x] + scaling * (forces[s, a, x] + forces_new[s, a, x])
+        return new_vels
+
     def step(self):
         forces = self._prev_forces
         if forces is None:
             forces = self.get_forces(self.coords)
 
-
         v = self.velocities
-        coords = self.coords + v * self.dt + forces / (2 * self._mass) * self.dt**2
-        if self._atomic_structs:
-            com = np.tensordot(self.masses, coords, axes=[0, -2]) / np.sum(self._mass)
-            coords = coords - com[:, np.newaxis, :] # don't let COM move
-        forces_new = self.get_forces(coords)
-        vels = v + self.dt * (forces + forces_new) / (2 * self._mass)
+        if self._atomic_structs and self.coords.ndim == 3:
+            # the force function is arbitrary python so only the integrator arithmetic is compiled
+            masses = self._float_masses
+            forces = np.broadcast_to(np.asanyarray(forces, dtype=float), self.coords.shape)
+            v = np.broadcast_to(np.asanyarray(v, dtype=float), self.coords.shape)
+            coords = self._verlet_coordinate_update(np.asanyarray(self.coords, dtype=float), v, forces, masses, self._inv_total_mass, self.dt)
+            forces_new = self.get_forces(coords)
+            vels = self._verlet_velocity_update(
+                v, forces,
+                np.broadcast_to(np.asanyarray(forces_new, dtype=float), coords.shape),
+                masses, self.dt
+            )
+        else:
+            coords = self.coords + v * self.dt + forces * self._inv_2mass * self.dt**2
+            if self._atomic_structs:
+                com = np.tensordot(self.masses, coords, axes=[0, -2]) * self._inv_total_mass
+                coords = coords - com[:, np.newaxis, :] # don't let COM move
+            forces_new = self.get_forces(coords)
+            vels = v + self.dt * (forces + forces_new) * self._inv_2mass
 
         self._prev_forces = forces_new
         self.velocities = vels
@@ -166,28 +217,60 @@ class AIMDSimulator:
 
         return coords, vels, forces_new
 
+    @property
+    def trajectory(self):
+        # the frames live in a buffer that gets reallocated as it grows, so we hand out a
+        # snapshot rather than a view that would silently stop tracking the simulation
+        return self._frames().copy()
+    @trajectory.setter
+    def trajectory(self, frames):
+        frames = np.asanyarray(frames)
+        if len(frames) == 0:
+            frames = frames.reshape((0,) + self.coords.shape)
+        self._traj_buffer = np.array(frames, dtype=np.result_type(frames, float))
+        self._traj_size = len(frames)
+    def _frames(self):
+        return self._traj_buffer[:self._traj_size]
+    def _reserve_frames(self, num_frames):
+        num_needed = self._traj_size + num_frames
+        if num_needed > len(self._traj_buffer):
+            new_buffer = np.empty(
+                (max(num_needed, 2 * len(self._traj_buffer)),) + self._traj_buffer.shape[1:],
+                dtype=self._traj_buffer.dtype
+            )
+            new_buffer[:self._traj_size] = self._traj_buffer[:self._traj_size]
+            self._traj_buffer = new_buffer
+    def _append_frame(self, coords):
+        self._reserve_frames(1)
+        self._traj_buffer[self._traj_size] = coords
+        self._traj_size += 1
+
     @staticmethod
     def _ke(_mass, v):
         # _mass and v are 2D b.c. atomic structs
         return 1 / 2 * np.sum(np.sum(_mass * v ** 2, axis=-1), axis=-1)
     def propagate(self, num_steps=1):
 
+        self._reserve_frames(
+            (self.steps + num_steps) // self.sampling_rate - self.steps // self.sampling_rate
+        )
         for _ in range(num_steps):
             c, v, f = self.step()
             if self.steps % self.sampling_rate == 0:
                 if self.kinetic_energies is not None:
                     self.kinetic_energies.append(self._ke(self._mass, v))
-                self.trajectory.append(c)
+                self._append_frame(c)
                 if self.velocity_deque is not None:
                     self.velocity_deque.append(v)
 
-        return self.trajectory
+        # a view of the recorded frames, valid until the buffer next grows
+        return self._frames()
 
     def build_interpolation(self, energy_function, interpolation_order=2,
                             equilibration_steps=None,
                             interpolator_class=None, eckart_embed=True, reference=None, **interpolator_options):
 
-        traj = np.array(self.trajectory)
+        traj = self._frames()
         if equilibration_steps is not None:
             traj = traj[equilibration_steps:]
         traj = traj.reshape((-1,) + traj.shape[-2:])
@@ -232,9 +315,7 @@ class AIMDSimulator:
                 )
             ref = ref.get_embedded_molecule(load_properties=False)
 
-            # all_crds = []
-            # all_ders = [[] for _ in range(interpolation_order)]
-
+            # embedding data is computed for the whole trajectory at once
             rots, _, (pax_traj, _, pax_rots) = ref.get_embedding_data(traj)
             traj = pax_traj @ np.swapaxes(rots, -2, -1)
 
@@ -243,29 +324,12 @@ class AIMDSimulator:
                 cshape = traj.shape[-2:]
 
                 # new_derivs = [vals[1] @ pax_rots @ np.swapaxes(rots, -2, -1)]
-                # raise Exception(new_derivs[0])
                 new_derivs = PropertyManager._transform_derivatives(
                     [v.reshape((-1,) + (npts,)*(i+1)) for i,v in enumerate(vals[1:])],
                     rots @ pax_rots
                 )
                 vals = [vals[0]] + [v.reshape((-1,) + cshape*(i+1)) for i,v in enumerate(new_derivs)]
 
-
-            # for crd_ders in zip(traj, *vals[1:]): #TODO: speed this up...
-            #     c = crd_ders[0]
-            #     mol = Molecule(
-            #         ["H"] * len(self.masses),
-            #         c,
-            #         masses=self.masses,
-            #         potential_derivatives=crd_ders[1:]
-            #     ).get_embedded_molecule(ref, load_properties=False)
-            #     all_crds.append(mol.coords)
-            #     pes = mol.potential_derivatives
-            #     for i, p in enumerate(pes):
-            #         all_ders[i].append(p)
-
-            # traj = np.array(all_crds)
-
         if interpolator_class is None:
             interpolator_class = RBFDInterpolator
 
@@ -276,7 +340,7 @@ class AIMDSimulator:
         if isinstance(embed, (np.ndarray, list, tuple)):
             ref_struct = np.asanyarray(embed)
             embed = True
-        base_coords = np.array(self.trajectory)
+        base_coords = self._frames()
         if flatten:
             base_coords = base_coords.reshape((-1,)+base_coords.shape[-2:])
         if extract_velocities is None:
@@ -326,7 +390,7 @@ class AIMDSimulator:
             else:
                 coords = mol.embed_coords(base_coords)
         else:
-            coords = base_coords
+            coords = base_coords.copy() # don't hand out a view of the recorded frames
         if extract_velocities:
             return coords, velocities
         else:
@@ -334,17 +398,56 @@ class AIMDSimulator:
 
 
 
+@mcmisc.njit(parallel=True)
+def _pairwise_eval_kernel(coords, pot):
+    natoms, ndim = coords.shape
+    vals = np.zeros(natoms)
+    for i in mcmisc.prange(natoms):
+        for j in range(natoms):
+            if i != j:
+                r2 = 0.
+                for x in range(ndim):
+                    dx = coords[i, x] - coords[j, x]
+                    r2 += dx * dx
+                vals[i] += pot(np.sqrt(r2))
+    return vals
+
+@mcmisc.njit(parallel=True)
+def _pairwise_forces_kernel(coords, pot_deriv):
+    natoms, ndim = coords.shape
+    forces = np.zeros((natoms, ndim))
+    for i in mcmisc.prange(natoms):
+        for j in range(natoms):
+            if i != j:
+                r2 = 0.
+                for x in range(ndim):
+                    dx = coords[i, x] - coords[j, x]
+                    r2 += dx * dx
+                r = np.sqrt(r2)
+                scaling = pot_deriv(r) / r
+                for x in range(ndim):
+                    forces[i, x] -= scaling * (coords[i, x] - coords[j, x])
+    return forces
+
 class PairwisePotential:
     def __init__(self, fun, deriv=None):
         self.fun = fun
         if deriv is None:
-            if hasattr(deriv, 'deriv'):
-                fun.deriv()
+            if hasattr(fun, 'deriv'):
+                deriv = fun.deriv()
             else:
                 deriv = self.numerical_deriv(fun)
         self.deriv = deriv
         self._inds = None # to cache indices when applied to same-shape data
 
+    @staticmethod
+    def _is_jitted(fun):
+        try:
+            from numba.core.dispatcher import Dispatcher
+        except ImportError:
+            return False
+        return isinstance(fun, Dispatcher)
+
     @classmethod
     def numerical_deriv(cls, fun, step_size=.01):
         @functools.wraps(fun)
@@ -356,71 +459,57 @@ class PairwisePotential:
         if self._inds is not None and len(coords) != self._inds[0]:
             self._inds = None
         if self._inds is None:
+            # int32 indices halve the bandwidth of the pair gathers, as long as
+            # every ordered pair can still be indexed with them
+            if len(coords) * (len(coords) - 1) < np.iinfo(np.int32).max:
+                ind_type = np.int32
+            else:
+                ind_type = np.int64
             row_inds, col_inds = np.triu_indices(len(coords), k=1)
-            _, row_map = np.unique(row_inds, return_index=True) # One element less than the coords
-            sorting = np.argsort(col_inds)
-            _, col_map = np.unique(col_inds, return_index=True) # One element less than the coords
-            self._inds = [len(coords), (row_inds, col_inds, row_map, sorting, col_map)]
+            row_inds = row_inds.astype(ind_type)
+            col_inds = col_inds.astype(ind_type)
+            npairs = len(row_inds)
+            # we lay out every ordered pair (i, j) so that the pairs for each atom
+            # are contiguous, which lets us do a single reduction with no reordering
+            pair_inds = np.concatenate([row_inds, col_inds])
+            sorting = np.argsort(pair_inds, kind='stable')
+            pair_map = (sorting % npairs).astype(ind_type) # which unique pair each ordered pair comes from
+            pair_signs = np.where(sorting < npairs, 1., -1.)
+            atom_starts = np.searchsorted(pair_inds[sorting], np.arange(len(coords))).astype(ind_type)
+            self._inds = [len(coords), (row_inds, col_inds, pair_map, pair_signs, atom_starts)]
         return self._inds[1]
 
     def eval(self, coords):
-        row_inds, col_inds, row_map, col_sort, col_map = self._get_inds_cached(coords)
+        if self._is_jitted(self.fun):
+            # fuse the pair loop and reduction when the potential can be called from compiled code
+            return _pairwise_eval_kernel(np.asanyarray(coords, dtype=float), self.fun)
+        row_inds, col_inds, pair_map, pair_signs, atom_starts = self._get_inds_cached(coords)
         pot = self.fun
 
-        # compute unsigned force for each pair
+        # compute the potential for each unique pair
         diffs = coords[row_inds] - coords[col_inds]
         dists = np.linalg.norm(diffs, axis=1)
         pot_vals = pot(dists)
 
-        # print(row_map)
-
-        # now reduce over different chunks for the positive contribs...
-        pos_chunks = np.add.reduceat(
-            pot_vals,
-            row_map
-        )
-        neg_chunks = np.add.reduceat(
-            pot_vals[col_sort],
-            col_map
-        )
-
-        return np.concatenate(
-            [
-                pos_chunks[:1],
-                pos_chunks[1:] + neg_chunks[:-1],
-                pos_chunks[-1:]
-            ],
-            axis=0
-        )
+        # and reduce over the pairs each atom participates in
+        return np.add.reduceat(pot_vals[pair_map], atom_starts)
 
     def forces(self, coords):
-        row_inds, col_inds, row_map, col_sort, col_map = self._get_inds_cached(coords)
+        if self._is_jitted(self.deriv):
+            return _pairwise_forces_kernel(np.asanyarray(coords, dtype=float), self.deriv)
+        row_inds, col_inds, pair_map, pair_signs, atom_starts = self._get_inds_cached(coords)
         pot_deriv = self.deriv
 
-        # compute unsigned force for each pair
+        # compute unsigned force for each pair, folding the normalization
+        # into the radial scaling so no normal vectors get materialized
         diffs = coords[row_inds] - coords[col_inds]
-        dists = np.linalg.norm(diffs, axis=1)
-        base_force = pot_deriv(dists)
-        normals = diffs / dists[:, np.newaxis]
-        force_list = -normals * base_force[:, np.newaxis]
-
-        # now reduce over different chunks for the positive contribs...
-        pos_chunks = np.add.reduceat(
-            force_list,
-            row_map
-        )
-        neg_chunks = np.add.reduceat(
-            force_list[col_sort],
-            col_map
-        )
+        dists = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+        force_list = diffs * (-pot_deriv(dists) / dists)[:, np.newaxis]
 
-        return np.concatenate(
-            [
-                pos_chunks[:1],
-                pos_chunks[1:] - neg_chunks[:-1],
-                pos_chunks[-1:]
-            ],
-            axis=0
+        # the force on `j` from the pair `(i, j)` is the negative of the force on `i`
+        return np.add.reduceat(
+            force_list[pair_map] * pair_signs[:, np.newaxis],
+            atom_starts
         )
 
     def __call__(self, coords):
@@ -302,27 +302,45 @@ class HarmonicOscillatorRaisingLoweringPolyTerms:
                 for l in range(0, d+1)
             ])
 
+    @classmethod
+    def load_tables(cls, n):
+        """
+        Makes sure the cached Stirling and binomial tables cover indices up through `n`
+        so that callers can index them directly
+
+        :param n:
+        :type n: int
+        """
+        size = 2 ** int(np.ceil(np.log2(max([64, n + 1]))))
+        if cls._stirlings is None or cls._stirlings.shape[0] <= n:
+            cls._stirlings = StirlingS1(size)
+        if cls._binomials is None or cls._binomials.shape[0] <= n:
+            cls._binomials = Binomial(size)
+
     @classmethod
     def s1(cls, i, j):
         if cls._stirlings is None or cls._stirlings.shape[0] <= i or cls._stirlings.shape[0] <= j:
-            cls._stirlings = StirlingS1(2 ** int(np.ceil(np.log2(max([64, i, j])))))
+            cls.load_tables(max(i, j))
         return cls._stirlings[i, j]
 
     @classmethod
     def binom(cls, i, j):
         if cls._binomials is None or cls._binomials.shape[0] <= i or cls._binomials.shape[0] <= j:
-            cls._binomials = Binomial(2 ** int(np.ceil(np.log2(max([64, i, j])))))
+            cls.load_tables(max(i, j))
         return cls._binomials[i, j]
 
     @classmethod
     def get_reduced_raising_lowering_coeffs(cls, a, b):
-        return np.array([
-            sum(
-                (cls.s1(b - w, j) * cls.binom(a, w) * cls.binom(b, w) * np.math.factorial(w) / (2 ** w))
-                for w in range(0, b - j + 1)
-            )
-            for j in range(0, b + 1)
-        ])
+        # s1(b - w, j) vanishes for j > b - w, so the truncated sum over w
+        # is just a vector-matrix product against rows of the Stirling table
+        cls.load_tables(max(a, b))
+        w = np.arange(b + 1)
+        facs = np.cumprod(np.concatenate([[1.], w[1:]]))
+        weights = (
+                cls._binomials[a, w].astype(float) * cls._binomials[b, w].astype(float)
+                * facs / (2. ** w)
+        )
+        return weights @ cls._stirlings[b - w, :b + 1]
 
 
 class HarmonicOscillatorMatrixGenerator:
@@ -7,7 +7,7 @@ import numpy as np, scipy.sparse as sp, os, tempfile as tf, time, gc, itertools
 from collections import OrderedDict
 from McUtils.Numputils import SparseArray
 import McUtils.Numputils as nput
-from McUtils.Scaffolding import Logger, NullLogger
+from McUtils.Scaffolding import Logger, NullLogger, MaxSizeCache
 from McUtils.Parallelizers import Parallelizer, SerialNonParallelizer
 
 from .StateSpaces import BasisStateSpace, SelectionRuleStateSpace, PermutationallyReducedStateSpace, BraKetSpace
@@ -26,6 +26,7 @@ class Operator:
     QQQ and pQp to be calculated block-by-block.
     Crucially, the underlying basis for the operator is assumed to be orthonormal.
     """
+    op_mat_cache_size = 128
     def __init__(self, funcs, quanta,
                  prod_dim=None,
                  symmetries=None,
@@ -76,6 +77,8 @@ class Operator:
         if skipped_indices is not None:
             skipped_indices = {tuple(i) for i in skipped_indices}
         self.skipped_indices = skipped_indices
+        self._op_mat_cache = MaxSizeCache(self.op_mat_cache_size)
+        self._inner_indices = {}
 
     def clear_cache(self):
         """
@@ -83,6 +86,7 @@ class Operator:
         :rtype:
         """
 
+        self._op_mat_cache = MaxSizeCache(self.op_mat_cache_size)
         funcs = self.funcs
         if not isinstance(funcs, tuple):
             funcs = (funcs,)
@@ -140,12 +144,16 @@ class Operator:
         dims = self.fdim
         if dims == 0:
             return None
-        n_terms = max(len(x) for x in self.selection_rules) if reduced_inds else self.mode_n
-        shp = (n_terms,) * dims
-        inds = np.indices(shp, dtype=int)
-        tp = np.roll(np.arange(dims + 1), -1)
-        base_tensor = np.transpose(inds, tp)
-        return base_tensor
+        reduced_inds = bool(reduced_inds)
+        if reduced_inds not in self._inner_indices:
+            n_terms = max(len(x) for x in self.selection_rules) if reduced_inds else self.mode_n
+            shp = (n_terms,) * dims
+            inds = np.indices(shp, dtype=int)
+            tp = np.roll(np.arange(dims + 1), -1)
+            base_tensor = np.transpose(inds, tp)
+            base_tensor.setflags(write=False) # shared across calls so we don't let it get mutated
+            self._inner_indices[reduced_inds] = base_tensor
+        return self._inner_indices[reduced_inds]
 
     def __getitem__(self, item):
         # check to see if we were actually given a bunch of bra and ket states
@@ -172,6 +180,7 @@ class Operator:
         state['_parallelizer'] = None
         state['logger'] = None
         state['_tensor'] = None
+        state['_op_mat_cache'] = MaxSizeCache(self.op_mat_cache_size)
         return state
 
     def _get_eye_tensor(self, states):
@@ -248,6 +257,8 @@ class Operator:
                             )
             indep_grps = np.logical_not(indep_grps)
             symmable = flat[indep_grps]
+            if not flat.flags.writeable:
+                flat = flat.copy()
 
             # pull out the groups of indices and sort them
             symmetriz_grps = [np.sort(symmable[:, g], axis=1) for g in ind_grps]
@@ -272,6 +283,52 @@ class Operator:
 
         return uinds, (inverse, np.argsort(indsort))
 
+    def _get_1d_operator_matrix(self, funcs, func_inds, dim):
+        """
+        Returns the (cached) product of the 1D representation matrices for the
+        funcs at positions `func_inds`, i.e. QQ -> Q.Q & QQQ -> Q.Q.Q
+
+        :param funcs: functions that generate 1D representation matrices
+        :type funcs:
+        :param func_inds: positions of the funcs acting on a single index
+        :type func_inds: tuple[int]
+        :param dim: size of the representation
+        :type dim: int
+        :return:
+        :rtype: sp.spmatrix
+        """
+        key = (func_inds, dim) if funcs is self.funcs else None
+        if key is not None and key in self._op_mat_cache:
+            return self._op_mat_cache[key]
+
+        mat = funcs[func_inds[0]](dim)  # type: sp.spmatrix
+        for k in func_inds[1:]:
+            mat = mat.dot(funcs[k](dim))
+
+        if key is not None:
+            self._op_mat_cache[key] = mat
+        return mat
+
+    @staticmethod
+    def _get_index_groups(inds):
+        """
+        Finds the unique indices (in order of first appearance) along with the positions
+        in `inds` that map onto each of them in a single pass.
+        There are only ever a handful of indices so a dict pass beats `np.unique` + sorting here.
+
+        :param inds:
+        :type inds:
+        :return:
+        :rtype: tuple[np.ndarray, list[tuple[int]]]
+        """
+        groups = {}
+        for k, i in enumerate(inds):
+            if i in groups:
+                groups[i].append(k)
+            else:
+                groups[i] = [k]
+        return np.array(list(groups.keys())), [tuple(g) for g in groups.values()]
+
     def _mat_prod_operator_terms(self, inds, funcs, states, sel_rules):
         """
         Evaluates product operator terms based on 1D representation matrices coming from funcs
@@ -287,7 +344,6 @@ class Operator:
         :return:
         :rtype:
         """
-        from collections import OrderedDict
 
         # We figure out which indices are actually unique; this gives us a way to map
         # indices onto operators
@@ -296,8 +352,7 @@ class Operator:
         # since it acts on the same index more times
         # The indices will be mapped onto ints for storage in `pieces`
 
-        uinds = OrderedDict((k, None) for k in inds)
-        uinds = np.array(list(uinds.keys()))
+        uinds, func_groups = self._get_index_groups(inds)
         states = states.take_subdimensions(uinds)
 
         if sel_rules is not None:
@@ -313,40 +368,23 @@ class Operator:
         max_dim = max(np.max(bras), np.max(kets))
         padding = 3  # for approximation reasons we need to pad our representations...
 
-        mm = {k: i for i, k in enumerate(uinds)}
-        subdim = len(uinds)
-        # set up a place to hold onto the pieces we'll calculate
-        pieces = [None] * subdim
-        # now we construct the reps from 1D ones
-        for f, i in zip(funcs, inds):
-            n = mm[i]  # makes sure that we fill in in the same order as uinds
-            if pieces[n] is None:
-                pieces[n] = f(max_dim + padding)  # type: sp.spmatrix
-            else:
-                # QQ -> Q.Q & QQQ -> Q.Q.Q
-                og = pieces[n]  # type: sp.spmatrix
-                pieces[n] = og.dot(f(max_dim + padding))
+        # now we construct the reps from 1D ones, using the funcs grouped by
+        # which index they act on (in the same order as uinds) so that the products
+        # can be reused across index tuples
+        pieces = [
+            self._get_1d_operator_matrix(funcs, g, max_dim + padding)
+            for g in func_groups
+        ]
 
         # now we take the requisite products of the chunks for the indices that are
         # potentially non-orthogonal
+        # (flattening each block up front means we never have to check for
+        # the scalar/matrix results sp.spmatrix indexing can hand back)
         chunk = None
         for i, j, o in zip(bras, kets, pieces):
             op = o  # type: sp.spmatrix
-            blob = np.asarray(op[i, j]).squeeze()
-            if chunk is None:
-                if isinstance(blob, (int, np.integer, float, np.floating)):
-                    chunk = np.array([blob])
-                else:
-                    chunk = np.asarray(blob)
-            else:
-                chunk = chunk * blob
-
-        # weird stuff can happen with sp.spmatrix
-        if (
-                isinstance(chunk, (int, np.integer, float, np.floating))
-                or (isinstance(chunk, np.ndarray) and chunk.ndim == 0)
-        ):
-            chunk = np.array([chunk])
+            blob = np.asarray(op[i, j]).reshape(-1)
+            chunk = blob if chunk is None else chunk * blob
 
         return chunk, all_sels
 
@@ -364,8 +402,7 @@ class Operator:
 
         # next we get the term generator defined by inds
         # this will likely end up calling uinds again, but ah well, that operation is cheap
-        uinds = OrderedDict((k, None) for k in inds)
-        uinds = np.array(list(uinds.keys()))
+        uinds, _ = self._get_index_groups(inds)
         # the issue here is that _this_ operation is not necessarily cheap...
         # the subdimension states still can be quite expensive to get indices from
         states = states.take_subdimensions(uinds)
@@ -425,8 +462,7 @@ class Operator:
             #       only on the number of quanta that can change within the set of indices
             #       so we should support applying them first & then only doing this for the rest
             if use_sel_rule_filtering and sel_rules is not None:
-                _, idx = np.unique(inds, return_index=True)
-                uinds = inds[np.sort(idx)]
+                uinds, _ = self._get_index_groups(inds)
                 states, non_orthog = states.apply_sel_rules_along(sel_rules, uinds)
                 if len(non_orthog) > 0:
                     states, non_orthog_2 = states.apply_non_orthogonality(inds)#, max_inds=self.fdim)
@@ -485,6 +521,31 @@ class Operator:
 
             return wat
 
+    @staticmethod
+    def _map_over_inds(func, inds, *args):
+        """
+        Applies `func` to every index vector along the last axis of `inds`,
+        storing the results in an object array (i.e. an `np.apply_along_axis` that doesn't
+        try to coerce the sparse results and only evaluates each distinct index vector once)
+
+        :param func:
+        :type func:
+        :param inds:
+        :type inds: np.ndarray
+        :return:
+        :rtype: np.ndarray
+        """
+        inds = np.asanyarray(inds)
+        flat = np.reshape(inds, (-1, inds.shape[-1]))
+        res = np.empty((len(flat),), dtype=object)
+        if len(flat) > 0:
+            uinds, inverse = np.unique(flat, axis=0, return_inverse=True)
+            vals = np.empty((len(uinds),), dtype=object)
+            for n, i in enumerate(uinds):
+                vals[n] = func(i, *args)
+            res = vals[np.reshape(inverse, -1)]
+        return np.reshape(res, inds.shape[:-1])
+
     def _get_pop_sequential(self, inds, idx, check_orthogonality=True, save_to_disk=False):
         """
         Sequential method for getting elements of our product operator tensors
@@ -499,8 +560,8 @@ class Operator:
         :rtype:
         """
 
-        res = np.apply_along_axis(self._calculate_single_pop_elements,
-                                  -1, inds, self.funcs, idx,
+        res = self._map_over_inds(self._calculate_single_pop_elements,
+                                  inds, self.funcs, idx,
                                   self.selection_rules,
                                   check_orthogonality
                                   )
@@ -623,8 +684,9 @@ class Operator:
                 inverse, preinv = inv_dat
                 res = res.flatten()[preinv][inverse]
 
-            wat = [x for y in res for x in y]
-            new = sp.vstack(wat)
+            # every block is already a (1, nstates) row so we stack the blocks directly
+            # rather than re-slicing each one row-by-row
+            new = sp.vstack(list(np.reshape(res, -1)), format='csr')
 
         shp = inds.shape if inds is not None else ()
         res = SparseArray.from_data(new, cache_block_data=False)
@@ -895,9 +957,9 @@ class Operator:
         :rtype:
         """
 
-        res = np.apply_along_axis(self._calculate_single_transf,
-                                  -1, inds, self.funcs, base_space, self.selection_rules
-                                  )
+        res = self._map_over_inds(self._calculate_single_transf,
+                                  inds, self.funcs, base_space, self.selection_rules
+                                  ).flatten()
 
         # spaces = [r[2] for r in res]
         brakets = [r[1] for r in res]
@@ -1139,6 +1201,8 @@ class ContractedOperator(Operator):
         """
         self.coeffs = coeffs
         self.axes = axes
+        self._contraction_axes = None
+        self._nonzero_coeff_inds = None
         if (
                 skipped_indices is None
                 and skipped_coefficient_threshold is not None
@@ -1166,20 +1230,83 @@ class ContractedOperator(Operator):
     def is_zero(self):
         return (isinstance(self.coeffs, (int, float, np.integer, np.floating)) and self.coeffs == 0)
 
+    @property
+    def contraction_axes(self):
+        """
+        The axes used to contract the operator tensor with the coefficients,
+        resolved once since every element block reuses them
+
+        :return:
+        :rtype: tuple[tuple[int], tuple[int]]
+        """
+        if self._contraction_axes is None:
+            axes = self.axes
+            if axes is None:
+                axes = (tuple(range(self.coeffs.ndim)),) * 2
+            else:
+                axes = tuple(tuple(a) for a in axes)
+            self._contraction_axes = axes
+        return self._contraction_axes
+
+    @property
+    def nonzero_coefficient_indices(self):
+        """
+        The (symmetry-reduced) operator indices with a nonzero coefficient
+        when the coefficients are fully contracted against the operator tensor,
+        or `None` if every index needs to be evaluated
+
+        :return:
+        :rtype: set[tuple[int]] | None
+        """
+        c = self.coeffs
+        if (
+                self._nonzero_coeff_inds is None
+                and isinstance(c, np.ndarray)
+                and self.axes is None
+                and c.ndim == self.fdim
+        ):
+            nz = np.argwhere(c != 0)
+            if len(nz) > 0:
+                # map through the same symmetry reduction used when evaluating elements
+                nz, _ = self.filter_symmetric_indices(nz)
+            self._nonzero_coeff_inds = {tuple(i) for i in nz}
+        return self._nonzero_coeff_inds
+
+    def _calculate_single_pop_elements(self, inds, funcs, states, sel_rules, *args, **kwargs):
+        # blocks that get contracted against a zero coefficient can't contribute
+        nz = self.nonzero_coefficient_indices
+        if nz is not None and tuple(inds) not in nz:
+            return sp.csr_matrix((1, len(states)), dtype='float')
+        return super()._calculate_single_pop_elements(inds, funcs, states, sel_rules, *args, **kwargs)
+
     def _get_element_block(self, idx, parallelizer=None, check_orthogonality=True, memory_constrained=False):
         c = self.coeffs
         if not isinstance(c, (int, np.integer, float, np.floating)):
             # takes an (e.g.) 5-dimensional SparseTensor and turns it into a contracted 2D one
-            axes = self.axes
-            if axes is None:
-                axes = (tuple(range(c.ndim)),) * 2
+            axes = self.contraction_axes
             subTensor = super().get_elements(idx, parallelizer=parallelizer, check_orthogonality=check_orthogonality, memory_constrained=memory_constrained)
 
             # we collect here to minimize the effect of memory spikes if possible
             # self.clear_cache()
             # SparseArray.clear_cache()
             gc.collect()
-            if isinstance(subTensor, np.ndarray):
+            if (
+                    self.axes is None
+                    and isinstance(c, np.ndarray)
+                    and c.ndim > 0
+                    and subTensor.ndim == c.ndim + 1
+                    and tuple(subTensor.shape[:-1]) == c.shape
+            ):
+                # full contraction over the operator indices is just a matrix-vector product
+                # with the (indices, states) matrix the elements are already stored as,
+                # so we skip the generic tensordot transposition
+                if isinstance(subTensor, np.ndarray):
+                    flat = np.reshape(subTensor, (c.size, subTensor.shape[-1]))
+                else:
+                    with subTensor.cache_options(enabled=False):
+                        flat = subTensor.reshape((c.size, subTensor.shape[-1])).ascsr()
+                contracted = np.asarray(flat.T.dot(np.reshape(c, -1))).squeeze()
+            elif isinstance(subTensor, np.ndarray):
                 if len(axes[1]) > 0:
                     contracted = np.tensordot(subTensor.squeeze(), c, axes=axes)
                 else:
@@ -1250,9 +1377,7 @@ class ContractedOperator(Operator):
         c = self.coeffs
         if not isinstance(c, (int, np.integer, float, np.floating)):
             # takes an (e.g.) 5-dimensional SparseTensor and turns it into a contracted 2D one
-            axes = self.axes
-            if axes is None:
-                axes = (tuple(range(c.ndim)),) * 2
+            axes = self.contraction_axes
 
             subTensor, brakets = super().apply_reduced(base_space, parallelizer=parallelizer, logger=logger)
 
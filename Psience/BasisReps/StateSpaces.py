@@ -4094,7 +4094,7 @@ class BraKetSpace:
     class OrthogonalIndexCalculator:
         def __init__(self, tests, trie):
             self.tests = tests # a bunch of t/f statements
-            self.pretest = tests.flatten().all()
+            self.pretest = tests.all()
             self.trie = trie # cached prefiltering
         def get_idx_comp(self, item):
             """
@@ -4176,28 +4176,22 @@ class BraKetSpace:
 
     def get_sel_rule_filter(self, rules):
 
-        import functools as fp
-
         bra, ket = self.state_pairs
 
         # we have a set of rules for every dimension in states...
-        # so we define a function that will tell us where any of the possible selection rules are satisfied
-        # and then we apply that in tandem to the quanta changes between bra and ket and the rules
+        # so we figure out where any of the possible selection rules are satisfied
+        # for the quanta changes between bra and ket and then AND those
+        # masks together in place to find the states that satisfy all the rules
         rules = [np.array(r) for r in rules]
 
-        # from McUtils.Scaffolding import Logger
-        # logger = Logger.lookup("debug")
-        # logger.log_print("oh! {r}", r=rules)
-        apply_rules = lambda diff, rule: fp.reduce(
-            lambda d, i: np.logical_or(d, diff == i),
-            rule[1:],
-            diff == rule[0]
-        )
-        sels = [
-            apply_rules(k - b, r) for b, k, r in zip(bra, ket, rules)
-        ]
-        # then we figure out which states by satisfied all the rules
-        return fp.reduce(np.logical_and, sels[1:], sels[0])
+        mask = None
+        for b, k, r in zip(bra, ket, rules):
+            sel = np.isin(k - b, r)
+            if mask is None:
+                mask = sel
+            else:
+                np.logical_and(mask, sel, out=mask)
+        return mask
 
     def take_subspace(self, sel):
         if self.changes is not None:
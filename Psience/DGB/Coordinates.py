@@ -383,15 +383,11 @@ class DGBWatsonModes(DGBCoords):
             # freqs = modes.freqs
             # freq_term = np.sqrt(freqs[np.newaxis, :] / freqs[:, np.newaxis])
             # zeta = zeta * freq_term[np.newaxis, np.newaxis]
-            bad_moms = np.where(mom_i <= 0)[0]
-            mom_i[bad_moms] = 1
-            B_e = 1 / (2 * mom_i)  # * UnitsData.convert("AtomicMassUnits", "AtomicUnitOfMass"))
-            B_e[bad_moms] = 0
-            return np.sum(B_e, axis=-1), sum(
-                B_e[:, a, np.newaxis, np.newaxis, np.newaxis, np.newaxis]
-                 * zeta[:, a, :, :, np. newaxis, np.newaxis]*zeta[:, a, np. newaxis, np.newaxis, :, :]
-                for a in range(B_e.shape[1])
-            )
+            # any structure with a degenerate moment of inertia gets no rotational contribution,
+            # masked in the division itself rather than patched up before and after
+            good_moms = np.logical_not(np.any(mom_i <= 0, axis=-1))
+            B_e = np.divide(1, 2 * mom_i, out=np.zeros(mom_i.shape), where=good_moms[:, np.newaxis])  # * UnitsData.convert("AtomicMassUnits", "AtomicUnitOfMass"))
+            return np.sum(B_e, axis=-1), np.einsum('pa,paij,pakl->pijkl', B_e, zeta, zeta)
 
         return coriolis_inertia_function
 
@@ -403,6 +403,7 @@ class DGB:
         return S * pot_mat
 
     default_solver_mode = 'similarity'
+    subset_solver_modes = ('classic', 'fix-heiberger')
     def diagonalize(self,
                     *,
                     mode=None,
@@ -416,7 +417,8 @@ class DGB:
                     low_rank_energy_cutoff=None,
                     low_rank_overlap_cutoff=None,
                     low_rank_shift=None,
-                    stable_eigenvalue_epsilon=None
+                    stable_eigenvalue_epsilon=None,
+                    num_states=None
                     ):
 
         if mode is None:
@@ -444,6 +446,9 @@ class DGB:
             else:
                 mode = self.default_solver_mode
 
+        # `num_states` only modifies the solvers that can compute a subset of the spectrum
+        if num_states is not None and mode not in self.subset_solver_modes:
+            raise ValueError("solver {} doesn't support `num_states`".format(mode))
 
         H = self.T + self.V
 
@@ -454,11 +459,12 @@ class DGB:
                 H, self.S, self,
                 min_singular_value=min_singular_value,
                 subspace_size=subspace_size,
-                nodeless_ground_state=nodeless_ground_state
+                nodeless_ground_state=nodeless_ground_state,
+                num_states=num_states
             )
 
         elif mode == 'fix-heiberger': # Implementation of the Fix-Heiberger algorithm
-            eigs, evecs = DGBEigensolver.fix_heiberger(H, self.S, self, eps=stable_eigenvalue_epsilon)
+            eigs, evecs = DGBEigensolver.fix_heiberger(H, self.S, self, eps=stable_eigenvalue_epsilon, num_states=num_states)
 
         elif mode == 'similarity':
             eigs, evecs = DGBEigensolver.similarity_mapped_solver(H, self.S, self,
@@ -513,6 +519,7 @@ class DGB:
                           min_singular_value=None,
                           nodeless_ground_state=None,
                           stable_eigenvalue_epsilon=None,
+                          num_states=None,
                           **wfn_opts
                           ):
         # print("======="*25)
@@ -524,7 +531,8 @@ class DGB:
             subspace_size=subspace_size,
             min_singular_value=min_singular_value,
             nodeless_ground_state=nodeless_ground_state,
-            stable_eigenvalue_epsilon=stable_eigenvalue_epsilon
+            stable_eigenvalue_epsilon=stable_eigenvalue_epsilon,
+            num_states=num_states
         )
         ops = {k:v for k,v in ops.items() if v is not None}
         eigs, evecs = self.diagonalize(**ops)
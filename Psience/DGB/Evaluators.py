@@ -1,12 +1,13 @@
 
-import abc, math, gc
+import abc, math, gc, os
+import concurrent.futures
 
 import numpy as np, itertools, functools
 
 from McUtils.Zachary import DensePolynomial, TensorDerivativeConverter
 from McUtils.Scaffolding import Logger
 from McUtils.Parallelizers import Parallelizer
-import McUtils.Numputils as nput
+import McUtils.Numputils as nput, McUtils.Misc as mcmisc
 
 __all__ = [
     "DGBEvaluator",
@@ -21,12 +22,17 @@ __all__ = [
 
 
 class OverlapGaussianData:
+    # number of threads used to evaluate derivative orders when a function can only
+    # return one order per call, `None` keeps the evaluations serial since we can't
+    # assume an arbitrary potential is thread-safe
+    derivative_threads = None
     def __init__(self,
                  input_data,
                  product_data
                  ):
         self._input_data = input_data
         self._product_data = product_data
+        self._function_cache = None
     @property
     def npts(self):
         return self.initial_centers.shape[0]
@@ -166,15 +172,19 @@ class OverlapGaussianData:
         logger = Logger.lookup(logger)
 
         if rows_cols is None:
-            rows, cols = np.triu_indices(len(alphas))
+            rows, cols = DGBEvaluator.triu_indices(len(alphas))
         else:
             rows, cols = rows_cols
 
         # a bit inefficient if all tfs are identity, but generality is good
         sigs = DGBEvaluator.get_inverse_covariances(alphas, transformations)
-        covs = DGBEvaluator.get_covariances(alphas, transformations)
         momenta = DGBEvaluator.get_phase_vectors(aligned_momenta, transformations)
+        # the plain covariances only feed the momentum terms
+        covs = DGBEvaluator.get_covariances(alphas, transformations) if momenta is not None else None
         new_sigs = sigs[rows] + sigs[cols]
+        # the precision-weighted centers only depend on a single Gaussian, so we compute
+        # them once over the N inputs rather than once per pair
+        weighted_centers = np.einsum('nij,nj->ni', sigs, centers)
 
         if chunk_size is not None:
             num_segments = new_sigs.shape[0] // chunk_size + 1
@@ -189,22 +199,26 @@ class OverlapGaussianData:
         logger.log_print("getting {nT} overlap Gaussians over {nC} chunks", nT=len(rows), nC=len(chunks))
         chunk_data = []
         for news, r, c in zip(chunks, row_chunks, col_chunks):
-            new_alphas, new_rots = np.linalg.eigh(news)  # eigenvalues of inverse tensor...
+            if news.shape[-1] == 1:
+                # 1x1 blocks are already diagonal, so skip the batched LAPACK dispatch entirely
+                new_alphas = news[:, :, 0]
+                new_rots = np.ones_like(news)
+                new_inv = 1 / news
+            else:
+                new_alphas, new_rots = np.linalg.eigh(news)  # eigenvalues of inverse tensor...
+                # the sum of two SPD precisions is well-conditioned enough that we can build
+                # the inverse from the decomposition we already have rather than a second LAPACK call
+                new_inv = (new_rots / new_alphas[:, np.newaxis, :]) @ new_rots.transpose(0, 2, 1)
             new_rots_inv = new_rots.transpose(0, 2, 1)
 
-            # I _could_ construct the inverse from the alphas and rotations
-            # but I think it makes more sense to use a potentially more stable
-            # inverse here...also it is apparently no slower...
-            new_inv = np.linalg.inv(news)
-            # new_inv = new_rots @ nput.vec_tensordiag(1 / new_alphas) @ new_rots.transpose(0, 2, 1)
-
-            new_centers = new_inv @ (
-                    sigs[r] @ centers[r][:, :, np.newaxis]
-                    + sigs[c] @ centers[c][:, :, np.newaxis]
-            )
-            new_centers = new_centers.reshape(centers[c].shape)
+            new_centers = np.einsum('pij,pj->pi', new_inv, weighted_centers[r] + weighted_centers[c])
             new_alphas = new_alphas / 2
-            sum_sigs = sigs[r] @ new_inv @ sigs[c]
+            # the gammas are needed later anyway, so we reuse one for the sum of inverses
+            # instead of running the full triple product
+            row_sigs = sigs[r]
+            row_gammas = new_inv @ row_sigs
+            col_gammas = new_inv @ sigs[c]
+            sum_sigs = row_sigs @ col_gammas
 
             # TODO: turn this into a proper object...
             chunk_data.append({
@@ -214,7 +228,9 @@ class OverlapGaussianData:
                 'inverse': new_inv,
                 'sum_inverse': sum_sigs,
                 'rotations': new_rots,
-                'inverse_rotations': new_rots_inv
+                'inverse_rotations': new_rots_inv,
+                'row_gammas': row_gammas,
+                'col_gammas': col_gammas
             })
 
 
@@ -233,15 +249,15 @@ class OverlapGaussianData:
             # expressed in terms of the global frame
             phases_sum = momenta[rows] + momenta[cols]
             phases_diff = momenta[rows] - momenta[cols]
-            rho_sum = np.reshape(new_cov @ phases_sum[:, :, np.newaxis], phases_sum.shape)
-            rho_diff = np.reshape(new_cov @ phases_diff[:, :, np.newaxis], phases_sum.shape)
+            rho_sum = np.einsum('pij,pj->pi', new_cov, phases_sum)
+            rho_diff = np.einsum('pij,pj->pi', new_cov, phases_diff)
             # dot momentum sum or difference into displacement from origin
-            corr_sum = np.reshape(new_centers[:, np.newaxis, :] @ phases_sum[:, :, np.newaxis], -1)
-            corr_diff = np.reshape(new_centers[:, np.newaxis, :] @ phases_diff[:, :, np.newaxis], -1)
+            corr_sum = np.einsum('pi,pi->p', new_centers, phases_sum)
+            corr_diff = np.einsum('pi,pi->p', new_centers, phases_diff)
             # compute the J+ terms we use for all derivations
-            scj = covs @ momenta[:, :, np.newaxis]
-            delta_j_sum = np.reshape(new_si @ (scj[rows] - scj[cols]), phases_sum.shape)
-            delta_j_diff = np.reshape(new_si @ (scj[rows] + scj[cols]), phases_diff.shape)
+            scj = np.einsum('nij,nj->ni', covs, momenta)
+            delta_j_sum = np.einsum('pij,pj->pi', new_si, scj[rows] - scj[cols])
+            delta_j_diff = np.einsum('pij,pj->pi', new_si, scj[rows] + scj[cols])
 
             # now express these in terms of the rotated frame
 
@@ -268,13 +284,11 @@ class OverlapGaussianData:
             delta_j_sum = None
             delta_j_diff = None
 
-        row_gammas = new_cov @ sigs[rows]
-        col_gammas = new_cov @ sigs[cols]
+        row_gammas = product_data['row_gammas']
+        col_gammas = product_data['col_gammas']
         disps = centers[rows] - centers[cols]
-        delta = np.reshape(new_si @ disps[:, :, np.newaxis], disps.shape)
+        delta = np.einsum('pij,pj->pi', new_si, disps)
         product_data.update({
-            'row_gammas':row_gammas,
-            'col_gammas':col_gammas,
             'gamma_diff':row_gammas - col_gammas,
             'center_diffs':disps,
             'center_delta':delta,
@@ -310,6 +324,49 @@ class OverlapGaussianData:
 
         return input_data, product_data
 
+    def get_function_derivatives(self, function, deriv_order):
+        """
+        Evaluates `function` and its derivatives through `deriv_order` at the product centers,
+        keeping the most recent evaluation so repeated integrals of the same function can reuse it
+
+        :param function:
+        :type function: callable
+        :param deriv_order:
+        :type deriv_order: int
+        :return:
+        :rtype: list[np.ndarray]
+        """
+        # embedded functions are rebuilt on every call, so we identify them by the underlying
+        # function and embedding and only hold on to the most recent evaluation
+        key = (
+            getattr(function, 'og_fn', function),
+            getattr(function, 'base_coords', None)
+        )
+        if self._function_cache is not None:
+            cached_key, cached = self._function_cache
+            if (
+                    cached_key[0] is key[0] and cached_key[1] is key[1]
+                    and len(cached) > deriv_order
+            ):
+                return cached[:deriv_order+1]
+
+        centers = self.centers
+        derivs = function(centers, deriv_order=deriv_order)
+        if isinstance(derivs, np.ndarray):  # didn't get the full list so we do the less efficient route'
+            eval_order = lambda d: function(centers) if d == 0 else function(centers, deriv_order=d)
+            nthreads = self.derivative_threads
+            if nthreads is not None and deriv_order > 0:
+                # the orders are independent and usually GIL-releasing NumPy work,
+                # so the function needs to be thread-safe to opt into this
+                nthreads = min(deriv_order + 1, os.cpu_count() if nthreads is True else nthreads)
+                with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+                    derivs = list(executor.map(eval_order, range(deriv_order + 1)))
+            else:
+                derivs = [eval_order(d) for d in range(deriv_order + 1)]
+        derivs = list(derivs)
+        self._function_cache = (key, derivs)
+        return derivs
+
     def take_subselection(self, positions):
         # we need to find the positions in the old stuff where we
         rows, cols = self.indices
@@ -321,7 +378,7 @@ class OverlapGaussianData:
             k: v[take_pos] if v is not None else v
             for k, v in self._product_data.items()
         }
-        rows, cols = np.triu_indices(len(positions))
+        rows, cols = DGBEvaluator.triu_indices(len(positions))
         new_prod['row_inds'] = rows
         new_prod['col_inds'] = cols
 
@@ -331,12 +388,91 @@ class OverlapGaussianData:
         }
 
         return type(self)(new_input, new_prod)
+@mcmisc.njit(cache=True)
+def _polyint_horner(c, coeffs, odd):
+    # evaluates sum_l coeffs[l] * c^(n-2l) as a polynomial in c^2
+    res = np.empty_like(c)
+    for i in range(c.shape[0]):
+        x = c[i] * c[i]
+        val = coeffs[0]
+        for k in range(1, coeffs.shape[0]):
+            val = val * x + coeffs[k]
+        if odd:
+            val = val * c[i]
+        res[i] = val
+    return res
+
+@mcmisc.njit(parallel=True, fastmath=True, cache=True)
+def _pair_quadratic_form(disps, mats):
+    # evaluates disps[n] . mats[n] . disps[n] for every pair without temporaries
+    npairs, ndim = disps.shape
+    res = np.empty(npairs)
+    for n in mcmisc.prange(npairs):
+        acc = 0.
+        for i in range(ndim):
+            row = 0.
+            for j in range(ndim):
+                row += mats[n, i, j] * disps[n, j]
+            acc += disps[n, i] * row
+        res[n] = acc
+    return res
+
+@mcmisc.njit(parallel=True, fastmath=True, cache=True)
+def _pair_diagonal_momentum(shift_mats, disps, inv_masses):
+    # evaluates 1/2 sum_k (shift_mats[n, k, k] - disps[n, k]^2) / m_k in one fused pass per pair
+    npairs, ndim = disps.shape
+    res = np.empty(npairs)
+    for n in mcmisc.prange(npairs):
+        acc = 0.
+        for k in range(ndim):
+            d = disps[n, k]
+            acc += (shift_mats[n, k, k] - d * d) * inv_masses[k]
+        res[n] = acc / 2
+    return res
+
 class DGBEvaluator:
     """
     An object that supports evaluating matrix elements in a distributed Gaussian basis.
     Provides support for integrating a function via quadrature or as an expansion in a polynomial tensors
     """
 
+    @classmethod
+    @functools.lru_cache(maxsize=16)
+    def triu_indices(cls, n):
+        """
+        Returns the (read-only) upper-triangle pair indices for `n` Gaussians,
+        cached since every matrix over the same basis is built on the same pairs
+
+        :param n:
+        :type n: int
+        :return:
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        rows, cols = np.triu_indices(n)
+        rows.setflags(write=False)
+        cols.setflags(write=False)
+        return rows, cols
+    @classmethod
+    def symmetric_pair_matrix(cls, npts, rows, cols, vals):
+        """
+        Builds the symmetric `(npts, npts, ...)` matrix with `vals` on the `(rows, cols)` pairs
+
+        :param npts:
+        :type npts: int
+        :param rows:
+        :type rows: np.ndarray
+        :param cols:
+        :type cols: np.ndarray
+        :param vals:
+        :type vals: np.ndarray
+        :return:
+        :rtype: np.ndarray
+        """
+        mat = np.zeros((npts, npts) + vals.shape[1:], dtype=np.result_type(vals.dtype, float))
+        mat[rows, cols] = vals
+        mat[cols, rows] = vals
+        return mat
+
     @classmethod
     def get_inverse_covariances(cls, alphas, transformations):
         """
@@ -348,15 +484,15 @@ class DGBEvaluator:
         :rtype:
         """
 
-        n = alphas.shape[-1]
-        npts = len(alphas)
-        covs = np.zeros((npts, n, n))
-        diag_inds = (slice(None, None, None),) + np.diag_indices(n)
-        covs[diag_inds] = 2 * alphas
-
+        diag = 2 * alphas
         if transformations is not None:
+            # scaling the columns of Q is the same as Q @ diag(d) without building the diagonal matrices
             tfs, inv = transformations
-            covs = tfs @ covs @ tfs.transpose((0, 2, 1))
+            covs = (tfs * diag[:, np.newaxis, :]) @ tfs.transpose((0, 2, 1))
+        else:
+            n = alphas.shape[-1]
+            covs = np.zeros((len(alphas), n, n))
+            np.einsum('pii->pi', covs)[...] = diag # writable view onto the diagonals
 
         return covs
 
@@ -371,15 +507,15 @@ class DGBEvaluator:
         :rtype:
         """
 
-        n = alphas.shape[-1]
-        npts = len(alphas)
-        covs = np.zeros((npts, n, n))
-        diag_inds = (slice(None, None, None),) + np.diag_indices(n)
-        covs[diag_inds] = 1/(2 * alphas)
-
+        diag = 1/(2 * alphas)
         if transformations is not None:
+            # scaling the columns of Q is the same as Q @ diag(d) without building the diagonal matrices
             tfs, inv = transformations
-            covs = tfs @ covs @ tfs.transpose((0, 2, 1))
+            covs = (tfs * diag[:, np.newaxis, :]) @ tfs.transpose((0, 2, 1))
+        else:
+            n = alphas.shape[-1]
+            covs = np.zeros((len(alphas), n, n))
+            np.einsum('pii->pi', covs)[...] = diag # writable view onto the diagonals
 
         return covs
 
@@ -458,38 +594,124 @@ class DGBEvaluator:
             ])
         return np.prod(nums/dens)
     @classmethod
+    @functools.lru_cache(maxsize=None)
+    def polyint_1D_coeffs(cls, n):
+        """
+        The coefficients of the 1D polynomial integral in powers of `c**2`,
+        ordered from highest to lowest power for Horner evaluation
+
+        :param n:
+        :type n: int
+        :return:
+        :rtype: np.ndarray
+        """
+        coeffs = np.array([
+            cls.poch(n, l) * (1/2**(2*l-n) if 2*l > n else 2**(n-2*l))
+            for l in range(0, int(np.floor(n/2)) + 1)
+        ], dtype=float)
+        coeffs.setflags(write=False)
+        return coeffs
+    @classmethod
     def polyint_1D(cls, centers, alphas, n):
         if n == 0:
             return np.ones(centers.shape[:2])
         c = np.sqrt(alphas) * centers
-        term = sum(
-            (cls.poch(n, l) * (1/2**(2*l-n) if 2*l > n else 2**(n-2*l)))*(c)**(n-2*l)
-            for l in range(0, int(np.floor(n/2)) + 1)
+        term = _polyint_horner(
+            np.ascontiguousarray(c, dtype=float).reshape(-1),
+            cls.polyint_1D_coeffs(n),
+            n % 2 == 1
         )
-        return term
+        return term.reshape(c.shape)
 
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def momentum_coeffient(cls, k, n):
         m = k//2
         s = (-1) ** k
-        fac = (-1)**(n) * np.prod(
-            2*np.arange(n+1, m+1, 2) - s
+        fac = (-1)**(n) * math.prod(
+            2*i - s for i in range(n+1, m+1, 2)
         )
-        bin = np.math.comb(m, n)
+        bin = math.comb(m, n)
         return bin * fac
     @classmethod
+    @functools.lru_cache(maxsize=None)
+    def momentum_coefficients(cls, k):
+        # all the expansion coefficients of the order `k` momentum integral, which are pure integers
+        return tuple(cls.momentum_coeffient(k, n) for n in range(0, int(np.ceil(k/2)) + 1))
+    @classmethod
+    def estrin_eval(cls, coeffs, x):
+        """
+        Evaluates the polynomial `sum(c[n] * x**n)` with Estrin's scheme,
+        pairing up terms so we only ever need repeated squarings of `x`
+
+        :param coeffs:
+        :type coeffs: Iterable[float]
+        :param x:
+        :type x: np.ndarray
+        :return:
+        :rtype: np.ndarray
+        """
+        coeffs = list(coeffs)
+        if len(coeffs) == 1:
+            return np.full(np.shape(x), coeffs[0], dtype=float)
+        while len(coeffs) > 1:
+            if len(coeffs) % 2 == 1:
+                coeffs.append(0)
+            coeffs = [coeffs[i] + coeffs[i + 1] * x for i in range(0, len(coeffs), 2)]
+            if len(coeffs) > 1:
+                x = x * x
+        return coeffs[0]
+    @classmethod
     def momentum_integral(cls, p, a, k):
         var = (p**2)/(2*a) # the rest of the sqrt(a) term is included elsewhere
-        expansion = sum(
-            cls.momentum_coeffient(k, n) * (var**n)
-            for n in range(0, int(np.ceil(k/2)) + 1)
+        expansion = cls.estrin_eval(
+            cls.momentum_coefficients(k),
+            var
         ) / (2*a)**np.ceil(k/2)
         if k%2 == 1:
             expansion = p * expansion
         return expansion
     @classmethod
+    def momentum_integral_table(cls, p, a, max_order):
+        """
+        Evaluates `momentum_integral` for every order up through `max_order`,
+        sharing the `p**2/2a` term and the powers of `1/2a` across orders
+
+        :param p:
+        :type p: np.ndarray
+        :param a:
+        :type a: np.ndarray
+        :param max_order:
+        :type max_order: int
+        :return:
+        :rtype: np.ndarray
+        """
+        two_a = 2 * a
+        var = (p**2) / two_a
+        inv_pows = cls._inverse_powers(two_a, int(np.ceil(max_order/2)))
+        table = []
+        for k in range(max_order + 1):
+            expansion = cls.estrin_eval(
+                cls.momentum_coefficients(k),
+                var
+            ) * inv_pows[int(np.ceil(k/2))]
+            if k%2 == 1:
+                expansion = p * expansion
+            table.append(expansion)
+        return np.array(table)
+    @staticmethod
+    def _inverse_powers(x, max_power):
+        # stack of x**-n for n = 0..max_power built by repeated multiplication
+        inv_x = 1 / x
+        pows = np.empty((max_power + 1,) + np.shape(x))
+        pows[0] = 1
+        for n in range(1, max_power + 1):
+            pows[n] = pows[n-1] * inv_x
+        return pows
+    @classmethod
     def simple_poly_int(cls, n):
         return np.prod(np.arange(1, n, 2)) / 2**(n/2) # double factorial/gamma/whatever
+    expansion_block_elements = int(1e7)
     @classmethod
     def tensor_expansion_integrate(cls,
                                    npts, derivs, overlap_data:'OverlapGaussianData',
@@ -526,6 +748,11 @@ class DGBEvaluator:
         new_derivs = []
         # rotations = rotations[:, :, :, np.newaxis] # to test shapes
         for n,d in enumerate(derivs):
+            if m_sum is None and n % 2 == 1:
+                # every odd-order index tuple has an odd power in some dimension, so these
+                # integrate to zero and aren't worth rotating
+                new_derivs.append(None)
+                continue
             for _ in range(n):
                 d = nput.vec_tensordot(
                     d, rotations,
@@ -541,103 +768,87 @@ class DGBEvaluator:
         row_inds = overlap_data.row_indices
         col_inds = overlap_data.col_indices
 
-        pot = np.zeros((npts, npts) + fshape)
-        caches = [{} for _ in range(ndim)]
-        # mom_sum_pot = np.zeros((npts, npts) + fshape) # for momentum sum
-        ms_caches = [{} for _ in range(ndim)]
+        if expansion_type == 'taylor':
+            raise NotImplementedError("Taylor series in rotated basis not implemented yet")
+
+        # the 1D integrals only depend on the dimension and the power, not on the
+        # derivative tensor or index tuple, so we tabulate them up front as (ndim, order, npairs)
+        max_order = len(derivs) - 1
+        if m_sum is not None:
+            int_table = np.moveaxis(cls.momentum_integral_table(m_diff, alphas, max_order), -1, 0)
+            ms_table = np.moveaxis(cls.momentum_integral_table(m_sum, alphas, max_order), -1, 0)
+        else:
+            # the powers of 1/alpha are shared by every order so we build them once
+            half_orders = np.ceil(np.arange(max_order + 1) / 2).astype(int)
+            inv_alpha_pows = cls._inverse_powers(alphas, half_orders[-1])
+            simple_ints = np.array([cls.simple_poly_int(n) for n in range(max_order + 1)])
+            int_table = np.moveaxis(
+                simple_ints[:, np.newaxis, np.newaxis] * inv_alpha_pows[half_orders],
+                -1, 0
+            )
+            ms_table = None
+        dim_range = np.arange(ndim)
+        fdim_axes = [-x for x in range(1, fdim+1)]
+        npairs = len(row_inds)
+        # bound the (num_tuples, npairs) blocks we work with at any one time
+        tuple_block_size = max(1, int(cls.expansion_block_elements // max(npairs, 1)))
+
+        # accumulate over the (row, col) pairs only and symmetrize once at the end
+        tri_pot = np.zeros((npairs,) + fshape)
+        factorials = np.array([math.factorial(n) for n in range(len(derivs))], dtype=float)
         for nd,d in enumerate(derivs): # add up all independent integral contribs...
+            if d is None: # vanishing odd order
+                continue
             # iterate over upper triangle coordinates (we'll add bottom contrib by symmetry)
-            inds = itertools.combinations_with_replacement(range(ndim), r=nd) if nd > 0 else [()]
-            for idx in inds:
-                count_map = {k: v for k, v in zip(*np.unique(idx, return_counts=True))}
-                if (
-                        expansion_type != 'taylor' and m_sum is None
-                        and any(n%2 !=0 for n in count_map.values())
-                ):
-                    continue # odd contribs vanish
-
-                contrib = 1
-                ms_contrib = 1
-                for k in range(ndim): # do each dimension of integral independently
-                    n = count_map.get(k, 0)
-                    if n not in caches[k]:
-                        if expansion_type == 'taylor':
-                            raise NotImplementedError("Taylor series in rotated basis not implemented yet")
-
-                        if m_sum is not None:
-                            caches[k][n] = cls.momentum_integral(
-                                m_diff[..., k],
-                                alphas[..., k],
-                                n
-                            )
-                            ms_caches[k][n] = cls.momentum_integral(
-                                m_sum[..., k],
-                                alphas[..., k],
-                                n
-                            )
-                        else:
-                            caches[k][n] = (
-                               cls.simple_poly_int(n)
-                                 if expansion_type != 'taylor' else
-                               cls.polyint_1D(centers[..., k], alphas[..., k], n)
-                            ) / alphas[..., k]**np.ceil(n/2)
-                    base_contrib = caches[k][n]
-                    for _ in range(fdim):
-                        base_contrib = np.expand_dims(base_contrib, -1)
-                    if isinstance(contrib, int) and fdim > 0:
-                        base_contrib = np.broadcast_to(base_contrib,  alphas.shape[:-1] + fshape)
-                    contrib *= base_contrib
-
-                    if m_sum is not None:
-                        base_contrib = ms_caches[k][n]
-                        for _ in range(fdim):
-                            base_contrib = np.expand_dims(base_contrib, -1)
-                        if isinstance(ms_contrib, int) and fdim > 0:
-                            base_contrib = np.broadcast_to(base_contrib, alphas.shape[:-1] + fshape)
-                        ms_contrib *= base_contrib
-
-                dcont = d[(slice(None, None, None),)*(fdim+1) + idx] if len(idx) > 0 else d
-                if reweight:
-                    # compute multinomial coefficient for weighting purposes
-                    _, counts = np.unique(idx, return_counts=True)
-                    multicoeff = 1
-                    for x in counts: multicoeff *= math.factorial(x)
-                    multicoeff = multicoeff / math.factorial(len(idx))
-                    scaling = multicoeff / math.factorial(nd)
-                    contrib *= scaling * dcont
-                    if m_sum is not None:
-                        ms_contrib *= scaling * dcont
-                else:
-                    contrib *= dcont
-                    if m_sum is not None:
-                        ms_contrib *= dcont
-
+            idx = list(itertools.combinations_with_replacement(range(ndim), r=nd))
+            idx = np.array(idx, dtype=int).reshape(len(idx), nd)
+            counts = np.sum(idx[:, :, np.newaxis] == dim_range[np.newaxis, np.newaxis, :], axis=1)
+            if m_sum is None: # odd contribs vanish
+                even = np.logical_not(np.any(counts % 2 != 0, axis=1))
+                idx = idx[even,]
+                counts = counts[even,]
+            if len(idx) == 0:
+                continue
+
+            if reweight:
+                # compute multinomial coefficient for weighting purposes
+                weights = np.prod(factorials[counts], axis=1) / factorials[nd]**2
+            else:
+                weights = np.ones(len(idx))
+
+            # every index tuple of this order is handled as one contraction over
+            # the gathered derivative components and the tabulated 1D integrals
+            flat_d = d.reshape(d.shape[:fdim+1] + (-1,))
+            flat_idx = np.ravel_multi_index(idx.T, (ndim,) * nd) if nd > 0 else np.zeros(1, dtype=int)
+            contrib = 0
+            ms_contrib = 0
+            for b in range(0, len(idx), tuple_block_size):
+                block = slice(b, b + tuple_block_size)
+                dsel = flat_d[..., flat_idx[block]]
+                polys = np.prod(int_table[dim_range, counts[block]], axis=1) * weights[block, np.newaxis]
+                contrib = contrib + np.einsum('tm,m...t->m...', polys, dsel)
                 if m_sum is not None:
-                    sum_prefac = overlap_data.decay_factor_sum
-                    diff_prefac = overlap_data.decay_factor_diff
-
-                    contrib *= np.expand_dims(
-                        overlap_data.cos_correlation_diff if nd%2 == 0 else -overlap_data.sin_correlation_diff,
-                        [-x for x in range(1, fdim+1)]
-                    )
-                    ms_contrib *= np.expand_dims(
-                        overlap_data.cos_correlation_sum if nd%2 == 0 else -overlap_data.sin_correlation_sum,
-                        [-x for x in range(1, fdim+1)]
-                    )
-
-                    if ms_contrib.ndim > 1:
-                        sum_prefac = sum_prefac[:, np.newaxis]
-                        diff_prefac = diff_prefac[:, np.newaxis]
-
-                    ms_contrib *= sum_prefac
-                    contrib *= diff_prefac
-                    # print("dd>", contrib[:5])
-
-                    contrib = contrib + ms_contrib
+                    polys = np.prod(ms_table[dim_range, counts[block]], axis=1) * weights[block, np.newaxis]
+                    ms_contrib = ms_contrib + np.einsum('tm,m...t->m...', polys, dsel)
+
+            if m_sum is not None:
+                contrib = contrib * np.expand_dims(
+                    overlap_data.decay_factor_diff * (
+                        overlap_data.cos_correlation_diff if nd%2 == 0 else -overlap_data.sin_correlation_diff
+                    ),
+                    fdim_axes
+                )
+                ms_contrib = ms_contrib * np.expand_dims(
+                    overlap_data.decay_factor_sum * (
+                        overlap_data.cos_correlation_sum if nd%2 == 0 else -overlap_data.sin_correlation_sum
+                    ),
+                    fdim_axes
+                )
+                contrib = contrib + ms_contrib
 
-                pot[row_inds, col_inds] += contrib
+            tri_pot += contrib
 
-        pot[col_inds, row_inds] = pot[row_inds, col_inds]
+        pot = cls.symmetric_pair_matrix(npts, row_inds, col_inds, tri_pot)
         # mom_sum_pot[col_inds, row_inds] = mom_sum_pot[row_inds, col_inds]
         #
         # if m_sum is not None:
@@ -647,24 +858,51 @@ class DGBEvaluator:
 
     @classmethod
     def quad_weight_eval(cls, function, d_chunk, w_chunk, ndim, centers, squa):
-        d = d_chunk[np.newaxis] / squa[:, np.newaxis]
-        c = centers[:, np.newaxis, :] + d
+        # build the (npts, nquad, ndim) evaluation grid in a single buffer
+        c = d_chunk[np.newaxis] / squa[:, np.newaxis]
+        c += centers[:, np.newaxis, :]
         fv = function(c.reshape(-1, ndim))
+        # contract the quadrature weights in directly instead of forming the weighted
+        # (npts, nquad, ...) product and then summing it
         if isinstance(fv, list):
             chunk_vals = []
             fshape = fv[0].shape[1:]
-            w_chunk = np.expand_dims(w_chunk, [0] + [-x for x in range(1, len(fshape) + 1)])
             for mv in fv:
                 mv = mv.reshape(c.shape[:2] + fshape)
-                chunk_vals.append(np.sum(w_chunk * mv, axis=1))
+                chunk_vals.append(np.einsum('nq...,q->n...', mv, w_chunk))
             return chunk_vals
         else:
             fshape = fv.shape[1:]
             fv = fv.reshape(c.shape[:2] + fshape)
-            w_chunk = np.expand_dims(w_chunk, [0] + [-x for x in range(1, len(fshape) + 1)])
-            chunk_val = np.sum(w_chunk * fv, axis=1)
+            chunk_val = np.einsum('nq...,q->n...', fv, w_chunk)
             return chunk_val
     @classmethod
+    @functools.lru_cache(maxsize=None)
+    def get_quadrature_grid(cls, degree, ndim):
+        """
+        Returns the tensor-product Gauss-Hermite displacements and weights,
+        which only depend on the `degree` and `ndim` so we only build them once
+
+        :param degree:
+        :type degree: int
+        :param ndim:
+        :type ndim: int
+        :return:
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        # Quadrature point displacements and weights (thanks NumPy!)
+        disps, weights = np.polynomial.hermite.hermgauss(degree)
+
+        indices = np.moveaxis(np.array(
+                np.meshgrid(*([np.arange(0, degree, dtype=int)] * ndim))
+            ), 0, -1).reshape(-1, ndim)
+        disps = np.ascontiguousarray(disps[indices])
+        w = np.prod(weights[indices], axis=-1)
+
+        disps.setflags(write=False)
+        w.setflags(write=False)
+        return disps, w
+    @classmethod
     def quad_nd(cls,
                 centers, alphas, function,
                 flatten=False,
@@ -687,16 +925,8 @@ class DGBEvaluator:
             alphas = [alphas]
         alphas = np.asanyarray(alphas)
 
-        # Quadrature point displacements and weights (thanks NumPy!)
-        disps, weights = np.polynomial.hermite.hermgauss(degree)
-
         ndim = centers.shape[-1]
-        indices = np.moveaxis(np.array(
-                np.meshgrid(*([np.arange(0, degree, dtype=int)] * ndim))
-            ), 0, -1).reshape(-1, ndim)
-        disps = disps[indices]
-
-        w = np.prod(weights[indices], axis=-1)
+        disps, w = cls.get_quadrature_grid(degree, ndim)
         n_disps = alphas.shape[0] * disps.shape[0] # how many structures total
         num_segments = n_disps // chunk_size + 1
         disp_chunks = np.array_split(disps, num_segments)
@@ -843,11 +1073,9 @@ class DGBEvaluator:
         )
 
         npts = overlap_data.npts
-        rows, cols = np.triu_indices(npts)
+        rows, cols = overlap_data.indices
 
-        pots = np.zeros((npts, npts) + vals.shape[1:])
-        pots[rows, cols] = vals
-        pots[cols, rows] = vals
+        pots = cls.symmetric_pair_matrix(npts, rows, cols, vals)
 
         return pots
 
@@ -867,14 +1095,15 @@ class DGBEvaluator:
             axis=1
         )
 
-        thing1 = np.prod(alphas[row_inds]/rotas, axis=1)
-        n = len(alphas)
-        rat_mat = np.zeros((n, n))
-        rat_mat[row_inds, col_inds] = thing1
-
         disps = overlap_data.center_difference
-        C = disps[:, np.newaxis, :] @ overlap_data.shift_matrices @ disps[:, :, np.newaxis]
-        C = C.reshape(disps.shape[0])
+        if hasattr(_pair_quadratic_form, 'py_func'):
+            # contract the quadratic form directly rather than going through the (M, d, 1) matmul temporaries
+            C = _pair_quadratic_form(
+                np.ascontiguousarray(disps, dtype=float),
+                np.ascontiguousarray(overlap_data.shift_matrices, dtype=float)
+            )
+        else: # numba unavailable, the interpreted loop would be slower than einsum
+            C = np.einsum('ni,nij,nj->n', disps, overlap_data.shift_matrices, disps, optimize=True)
 
         return row_inds, col_inds, ndim, det_rat, C
 
@@ -901,17 +1130,19 @@ class DGBEvaluator:
 
             full_terms = full_terms / norms
 
-            prefac = np.eye(n)
-            prefac[row_inds, col_inds] = full_terms
-            prefac[col_inds, row_inds] = prefac[row_inds, col_inds]
-
             decay_contrib = (
                     overlap_data.decay_factor_diff * overlap_data.cos_correlation_diff
                     + overlap_data.decay_factor_sum * overlap_data.cos_correlation_sum
             )
-            S[row_inds, col_inds] = decay_contrib
-            S[col_inds, row_inds] = decay_contrib
-            S = S * prefac
+            # only the (row, col) pairs carry information, so we take the product there
+            # instead of multiplying two full N x N matrices
+            S[row_inds, col_inds] = decay_contrib * full_terms
+            S[col_inds, row_inds] = S[row_inds, col_inds]
+
+            if return_prefactor:
+                prefac = np.eye(n)
+                prefac[row_inds, col_inds] = full_terms
+                prefac[col_inds, row_inds] = prefac[row_inds, col_inds]
 
         else:
             S[row_inds, col_inds] = full_terms
@@ -1131,16 +1362,13 @@ class DGBKineticEnergyEvaluator(DGBEvaluator):
     def evaluate_diagonal_rotated_momentum_contrib(self, overlap_data:'OverlapGaussianData', masses):
         # polynomial eval is too slow, need to fix in general but this is faster in the meantime
         si_cov = overlap_data.shift_matrices
-        diag_inds = np.diag_indices_from(si_cov[0])
         delta_vec = overlap_data.delta_position
-        shift_contrib = (delta_vec)**2
-        diag_inds = (slice(None),) + diag_inds
-        diag_contrib = si_cov[diag_inds]
-
-        base_contrib = diag_contrib - shift_contrib
 
         j = overlap_data.initial_phases
         if j is not None:
+            diag_inds = (slice(None),) + np.diag_indices_from(si_cov[0])
+            base_contrib = si_cov[diag_inds] - delta_vec**2
+
             jp_diff = overlap_data.delta_phase_diff
             jp_sum = overlap_data.delta_phase_sum
 
@@ -1164,14 +1392,19 @@ class DGBKineticEnergyEvaluator(DGBEvaluator):
             diff_prefac = overlap_data.decay_factor_diff
             contrib = diff_prefac * diff_contrib + sum_prefac * sum_contrib
 
-        else:
-            contrib = 1 / 2 * np.dot(base_contrib, 1 / masses)
+        elif hasattr(_pair_diagonal_momentum, 'py_func'):
+            contrib = _pair_diagonal_momentum(
+                np.ascontiguousarray(si_cov, dtype=float),
+                np.ascontiguousarray(delta_vec, dtype=float),
+                1 / np.asanyarray(masses, dtype=float)
+            )
+        else: # numba unavailable, the interpreted loop would be slower than the vectorized form
+            diag_inds = (slice(None),) + np.diag_indices_from(si_cov[0])
+            contrib = 1 / 2 * np.dot(si_cov[diag_inds] - delta_vec**2, 1 / masses)
 
         n = overlap_data.npts
         rows, cols = overlap_data.indices
-        ke = np.zeros((n, n))
-        ke[rows, cols] = contrib
-        ke[cols, rows] = contrib
+        ke = self.symmetric_pair_matrix(n, rows, cols, contrib)
         return ke
 
 class DGBCartesianEvaluator(DGBKineticEnergyEvaluator):
@@ -1250,6 +1483,71 @@ class DGBWatsonEvaluator(DGBKineticEnergyEvaluator):
             +(Jp[:, v]*Xc[:, m]+Dx[:, v]*r[:, m])*DG[:, n, u]
         )
     @classmethod
+    def coriolis_term_contrib(cls,
+                              coriolis_tensors,
+                              Xc, Dx, Sc, Sp,
+                              Gi, Gj, DG
+                              ):
+        """
+        Contracts `annoying_coriolis_term` against the Coriolis tensors over all `(n, u, m, v)` at once
+
+        :param coriolis_tensors: the Coriolis tensors with the `n == u` and `m == v` blocks already zeroed
+        :type coriolis_tensors: np.ndarray
+        :return:
+        :rtype: np.ndarray
+        """
+        XX = Xc[:, :, np.newaxis] * Xc[:, np.newaxis, :] + Sc
+        DD = Dx[:, :, np.newaxis] * Dx[:, np.newaxis, :] - Sp
+        return (
+                np.einsum('pnumv,pnm,puv->p', coriolis_tensors, XX, DD, optimize=True)
+                - np.einsum('pnumv,pmv,pnu->p', coriolis_tensors, Gi, Gj, optimize=True)
+                - np.einsum('pnumv,pmu,pnu->p', coriolis_tensors, Gi, Gj, optimize=True)
+                - np.einsum('pnumv,pv,pn,pmu->p', coriolis_tensors, Dx, Xc, DG, optimize=True)
+                - np.einsum('pnumv,pv,pm,pnu->p', coriolis_tensors, Dx, Xc, DG, optimize=True)
+        )
+    @classmethod
+    def coriolis_momentum_term_contribs(cls,
+                                        coriolis_tensors,
+                                        Xc, r, Jp, Dx,
+                                        Sc, Sp, DG
+                                        ):
+        """
+        Contracts `annoying_coriolis_momentum_term` and `annoying_imaginary_momentum_term`
+        against the Coriolis tensors over all `(n, u, m, v)` at once
+
+        :param coriolis_tensors: the Coriolis tensors with the `n == u` and `m == v` blocks already zeroed
+        :type coriolis_tensors: np.ndarray
+        :return: the real and imaginary contributions
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        XX = Xc[:, :, np.newaxis] * Xc[:, np.newaxis, :] + Sc
+        rr = r[:, :, np.newaxis] * r[:, np.newaxis, :]
+        JJ = Jp[:, :, np.newaxis] * Jp[:, np.newaxis, :]
+        DD = Dx[:, :, np.newaxis] * Dx[:, np.newaxis, :] - Sp
+        Xr = Xc[:, :, np.newaxis] * r[:, np.newaxis, :]
+        Xr = Xr + Xr.transpose(0, 2, 1) # Xc_n r_m + Xc_m r_n
+        DJ = Jp[:, :, np.newaxis] * Dx[:, np.newaxis, :]
+        DJ = DJ + DJ.transpose(0, 2, 1) # Dx_v Jp_u + Dx_u Jp_v
+
+        real = (
+                np.einsum('pnumv,puv,pnm->p', coriolis_tensors, JJ, XX - (r**2)[:, np.newaxis, :], optimize=True)
+                - np.einsum('pnumv,pmn,puv->p', coriolis_tensors, rr, DD, optimize=True)
+                - np.einsum('pnumv,pnm,puv->p', coriolis_tensors, Xr, DJ, optimize=True)
+                + np.einsum('pnumv,pv,pn,pmu->p', coriolis_tensors, Jp, r, DG, optimize=True)
+                + np.einsum('pnumv,pv,pm,pnu->p', coriolis_tensors, Jp, r, DG, optimize=True)
+        )
+
+        # Jp_v Xc_n + Dx_v r_n, indexed as [p, n, v]
+        K = Xc[:, :, np.newaxis] * Jp[:, np.newaxis, :] + r[:, :, np.newaxis] * Dx[:, np.newaxis, :]
+        imag = (
+                - np.einsum('pnumv,pnm,puv->p', coriolis_tensors, Xr, DD - JJ, optimize=True)
+                - np.einsum('pnumv,pnm,puv->p', coriolis_tensors, XX - rr, DJ, optimize=True)
+                + np.einsum('pnumv,pnv,pmu->p', coriolis_tensors, K, DG, optimize=True)
+                + np.einsum('pnumv,pmv,pnu->p', coriolis_tensors, K, DG, optimize=True)
+        )
+
+        return real, imag
+    @classmethod
     def evaluate_coriolis_contrib(cls, coriolis_tensors, overlap_data:'OverlapGaussianData'):
 
         Sc = overlap_data.covariance_matrices
@@ -1268,21 +1566,12 @@ class DGBWatsonEvaluator(DGBKineticEnergyEvaluator):
         Dx = overlap_data.center_difference
         Dx = np.reshape(Sp @ overlap_data.center_difference[:, :, np.newaxis], Dx.shape)
 
+        # zero out the n == u and m == v blocks once so every term can be a single contraction
         ndim = Xc.shape[-1]
+        off_diag = 1 - np.eye(ndim)
+        ct = coriolis_tensors * (off_diag[:, :, np.newaxis, np.newaxis] * off_diag[np.newaxis, np.newaxis, :, :])
 
-        term = lambda n, u, m, v: coriolis_tensors[:, n, u, m, v] * cls.annoying_coriolis_term(
-            n, u, m, v,
-
-            Xc, Dx, Sc, Sp,
-            Gi, Gj, DG
-        )
-
-        contrib = np.zeros(Sc.shape[0])
-        inds = itertools.product(*[range(ndim)]*4)
-        for n,u,m,v in inds:
-            if n != u and m != v:
-                t = term(n, u, m, v)
-                contrib += t
+        contrib = cls.coriolis_term_contrib(ct, Xc, Dx, Sc, Sp, Gi, Gj, DG)
 
         if overlap_data.initial_momenta is not None:
             jp_sum = overlap_data.delta_phase_sum
@@ -1290,51 +1579,16 @@ class DGBWatsonEvaluator(DGBKineticEnergyEvaluator):
             rho_sum = overlap_data.rho_sum
             rho_diff = overlap_data.rho_diff
 
-            sum_real_term = lambda n, u, m, v: coriolis_tensors[:, n, u, m, v] * cls.annoying_coriolis_momentum_term(
-                    n, u, m, v,
-
-                    Xc, rho_sum, jp_sum, Dx,
-                    Sc, Sp, DG
-            )
-            sum_imag_term = lambda n, u, m, v: coriolis_tensors[:, n, u, m, v] * cls.annoying_imaginary_momentum_term(
-                n, u, m, v,
-
+            sum_real_contrib, sum_imag_contrib = cls.coriolis_momentum_term_contribs(
+                ct,
                 Xc, rho_sum, jp_sum, Dx,
                 Sc, Sp, DG
             )
-
-            diff_real_term = lambda n, u, m, v: coriolis_tensors[:, n, u, m, v] * cls.annoying_coriolis_momentum_term(
-                n, u, m, v,
-
+            diff_real_contrib, diff_imag_contrib = cls.coriolis_momentum_term_contribs(
+                ct,
                 Xc, rho_diff, jp_diff, Dx,
                 Sc, Sp, DG
             )
-            diff_imag_term = lambda n, u, m, v: coriolis_tensors[:, n, u, m, v] * cls.annoying_imaginary_momentum_term(
-                n, u, m, v,
-
-                Xc, rho_diff, jp_diff, Dx,
-                Sc, Sp, DG
-            )
-
-            sum_real_contrib = np.zeros(Sc.shape[0])
-            sum_imag_contrib = np.zeros(Sc.shape[0])
-            diff_real_contrib = np.zeros(Sc.shape[0])
-            diff_imag_contrib = np.zeros(Sc.shape[0])
-            inds = itertools.product(*[range(ndim)] * 4)
-            for n, u, m, v in inds:
-                if n != u and m != v:
-                    real_cont = sum_real_term(n, u, m, v)
-                    imag_cont = sum_imag_term(n, u, m, v)
-                    # print("Sum I:", (n, u, m, v), 219475*imag_cont)
-                    # print("Sum R:", (n, u, m, v), 219475*real_cont)
-                    sum_real_contrib += real_cont
-                    sum_imag_contrib += imag_cont
-                    real_cont = diff_real_term(n, u, m, v)
-                    imag_cont = diff_imag_term(n, u, m, v)
-                    # print("Diff I:", (n, u, m, v), 219475*imag_cont)
-                    # print("Diff R:", (n, u, m, v), 219475*real_cont)
-                    diff_real_contrib += real_cont
-                    diff_imag_contrib += imag_cont
 
             cos_sum, sin_sum = overlap_data.correlation_factors_sum
             cos_diff, sin_diff = overlap_data.correlation_factors_diff
@@ -1353,9 +1607,7 @@ class DGBWatsonEvaluator(DGBKineticEnergyEvaluator):
             contrib = diff_prefac * diff_contrib + sum_prefac * sum_contrib
 
         npts = overlap_data.npts
-        ke = np.zeros((npts, npts))
-        ke[rows, cols] = -contrib
-        ke[cols, rows] = -contrib
+        ke = cls.symmetric_pair_matrix(npts, rows, cols, -contrib)
 
         return ke
 
@@ -1501,18 +1753,12 @@ class DGBPotentialEnergyEvaluator(DGBEvaluator):
                     for d in derivs
                 ]
             else:
-                alphas = overlap_data.alphas
-                centers = overlap_data.centers
                 if overlap_data.momenta_sum is None:
                     deriv_order = deriv_order - (deriv_order % 2) # odd orders don't contribute so why evaluate the derivatives...
                 # if self.mass_weighted:
                 #     derivs = self.mass_weighted_eval(function, centers, self.masses, deriv_order=deriv_order)
                 # else:
-                derivs = function(centers, deriv_order=deriv_order)
-                if isinstance(derivs, np.ndarray):  # didn't get the full list so we do the less efficient route'
-                    derivs = [function(centers)] + [
-                        function(centers, deriv_order=d) for d in range(1, deriv_order+1)
-                    ]
+                derivs = overlap_data.get_function_derivatives(function, deriv_order)
 
             if deriv_corrs is not None:
                 _ = []
@@ -1542,11 +1788,10 @@ class DGBPotentialEnergyEvaluator(DGBEvaluator):
         #     pot *= pref
 
         if pot_contribs is not None: # implies no rotation
-            row_inds, col_inds = np.triu_indices(npts)
-            pot2 = np.zeros((npts, npts))
-            pot2[row_inds, col_inds] = pot_contribs
-            pot2[col_inds, row_inds] = pot_contribs
-            pot += pot2
+            # add straight into the upper triangle and re-mirror instead of building a second N x N matrix
+            row_inds, col_inds = overlap_data.indices
+            pot[row_inds, col_inds] += pot_contribs
+            pot[col_inds, row_inds] = pot[row_inds, col_inds]
 
         return pot
 
@@ -1,4 +1,5 @@
-import numpy as np
+import math
+import numpy as np, scipy as sp
 
 from McUtils.Coordinerds import CartesianCoordinates1D, CartesianCoordinates2D, CartesianCoordinates3D
 from McUtils.Scaffolding import Logger
@@ -72,20 +73,24 @@ class DGBGaussians:
 
         self.coords = coords
         if isinstance(alphas, (int, float, np.integer, np.floating)):
-            alphas = [alphas] * self.coords.shape[0]
+            alphas = np.broadcast_to(np.float64(alphas), (self.coords.shape[0],)) # zero-copy
         self.alphas = np.asanyarray(alphas)
 
 
         if self.alphas.ndim == 1:
             self.alphas = np.broadcast_to(self.alphas[:, np.newaxis], self.coords.shape)
+        # every pair evaluation gathers from these, so we pay for a single dense copy up front
+        # instead of having each fancy-index re-materialize the zero-stride broadcast
+        self.alphas = np.ascontiguousarray(self.alphas, dtype=np.float64)
         self._transforms = self.canonicalize_transforms(self.alphas, transformations)
 
         if isinstance(momenta, (int, float, np.integer, np.floating)):
-            momenta = [momenta] * self.coords.shape[0]
+            momenta = np.broadcast_to(np.float64(momenta), (self.coords.shape[0],))
         if momenta is not None:
             momenta = np.asanyarray(momenta)
             if momenta.ndim == 1:
                 momenta = np.broadcast_to(momenta[:, np.newaxis], self.alphas.shape)
+            momenta = np.ascontiguousarray(momenta, dtype=np.float64)
         self.momenta = momenta
 
         self._overlap_data = None
@@ -176,29 +181,33 @@ class DGBGaussians:
             kinetic_options=self.kinetic_options
         )
         
+        # when nothing was pruned the existing matrices can be shared outright,
+        # otherwise we build the block index once and reuse it for every cached matrix
+        full_good_pos = np.asanyarray(full_good_pos)
+        identity_selection = (
+                len(full_good_pos) == len(self.alphas)
+                and np.array_equal(full_good_pos, np.arange(len(self.alphas)))
+        )
+        idx = None if identity_selection else np.ix_(full_good_pos, full_good_pos)
+        def take_block(base):
+            if idx is None:
+                return base
+            elif isinstance(base, tuple):
+                return (base[0][idx], base[1][idx])
+            else:
+                return base[idx]
+
         if self._overlap_data is not None:
-            new._overlap_data = self.overlap_data.take_subselection(full_good_pos)
-        if self._pref is not None:
-            base = self._pref
-            idx = np.ix_(full_good_pos, full_good_pos)
-            if isinstance(base, tuple):
-                new._pref = (base[0][idx], base[1][idx])
+            if identity_selection:
+                new._overlap_data = self._overlap_data
             else:
-                new._pref = base[idx]
+                new._overlap_data = self.overlap_data.take_subselection(full_good_pos)
+        if self._pref is not None:
+            new._pref = take_block(self._pref)
         if self._S is not None:
-            base = self._S
-            idx = np.ix_(full_good_pos, full_good_pos)
-            if isinstance(base, tuple):
-                new._S = (base[0][idx], base[1][idx])
-            else:
-                new._S = base[idx]
+            new._S = take_block(self._S)
         if self._T is not None:
-            base = self._T
-            idx = np.ix_(full_good_pos, full_good_pos)
-            if isinstance(base, tuple):
-                new._T = (base[0][idx], base[1][idx])
-            else:
-                new._T = base[idx]
+            new._T = take_block(self._T)
 
         return new
 
@@ -478,16 +487,18 @@ class DGBGaussians:
             S = self.S
 
         with logger.block(tag='optimizing by taking subspaces of the overlap matrix'):
-            sig, evecs = np.linalg.eigh(S)
-            # for i in range(5):
-            #     print("wtf", i, len(np.unique(np.where(np.abs(evecs[:, -(i+1):]) > contrib_cutoff)[0])), sig[-(i+1)],
-            #           np.min(evecs[:, -(i+1)]), np.max(evecs[:, -(i+1)]), np.std(evecs[:, -(i+1)]))
+            # we only ever look at the leading part of the spectrum, so we have LAPACK
+            # compute just those eigenpairs rather than the full decomposition
             if num_vectors:
-                good_loc = slice(max(len(sig) - num_vectors, 0), len(sig))
+                subset_opts = dict(subset_by_index=[max(len(S) - num_vectors, 0), len(S) - 1])
             else:
                 # self.logger.log_print("most important center threshold: {t}", t=min_singular_value)
-                good_loc = np.where(sig > min_value)[0]
-            full_good_pos = np.unique(np.where(np.abs(evecs[:, good_loc]) > contrib_cutoff)[0])
+                subset_opts = dict(subset_by_value=[min_value, np.inf])
+            sig, evecs = sp.linalg.eigh(S, driver='evr', check_finite=False, **subset_opts)
+            # for i in range(5):
+            #     print("wtf", i, len(np.unique(np.where(np.abs(evecs[:, -(i+1):]) > contrib_cutoff)[0])), sig[-(i+1)],
+            #           np.min(evecs[:, -(i+1)]), np.max(evecs[:, -(i+1)]), np.std(evecs[:, -(i+1)]))
+            full_good_pos = np.unique(np.where(np.abs(evecs) > contrib_cutoff)[0])
             logger.log_print("pruned {nD} Gaussians",  nD=len(S)-len(full_good_pos))
 
         return full_good_pos
@@ -539,18 +550,27 @@ class DGBGaussians:
     def _prune_dists(self, *,  cluster_radius, logger=None):
         with logger.block(tag=logger.log_print('declustering data with a radius of {r}', r=cluster_radius)):
             points = self.coords.centers
-            pivots = np.arange(len(points))
             dec_pts = points.reshape(points.shape[0], -1)
-            for i in range(len(points)):
-                cur_pos = pivots[i]
-                dists = np.linalg.norm(
-                    dec_pts[cur_pos][np.newaxis, :] - dec_pts[pivots[i + 1:], :],
-                    axis=1
-                )
-                good_pos = np.where(dists > cluster_radius)
-                if len(good_pos) == 0 or len(good_pos[0]) == 0:
+            npts = len(dec_pts)
+            # build the neighbor structure once and only ever ask for the points around each
+            # surviving pivot instead of recomputing displacements to everything left
+            tree = sp.spatial.cKDTree(dec_pts)
+            alive = np.ones(npts, dtype=bool)
+            num_remaining = npts
+            for i in range(npts - 1):
+                if not alive[i]:
+                    continue
+                num_remaining -= 1 # everything after this pivot
+                if num_remaining == 0:
+                    break
+                nearby = np.array(tree.query_ball_point(dec_pts[i], cluster_radius), dtype=int)
+                nearby = nearby[nearby > i]
+                nearby = nearby[alive[nearby]]
+                if len(nearby) == num_remaining: # nothing left outside the radius
                     break
-                pivots = np.concatenate([pivots[:i + 1], pivots[i + 1:][good_pos]])
+                alive[nearby] = False
+                num_remaining -= len(nearby)
+            pivots = np.where(alive)[0]
             logger.log_print("pruned {nD} Gaussians", nD=len(self.coords.centers) - len(pivots))
         return pivots
 
@@ -956,20 +976,38 @@ class DGBGaussians:
         return a
 
     @classmethod
-    def get_min_distance_alphas(cls, masses, centers, scaling=1/4, use_mean=False):
+    def get_min_distance_alphas(cls, centers, *, masses, scaling=1/4, use_mean=False):
         # if clustering_radius is None:
         #     clustering_radius = 1
         # np.sqrt(masses / min_dist)
-        distances = np.linalg.norm(centers[:, np.newaxis, :] - centers[np.newaxis, :, :], axis=-1)
-        # mean_dist = np.average(distances[distances > 1e-8], axis=None)
-        distances[distances < 1e-8] = np.max(distances) # exclude zeros
-        closest = np.min(distances, axis=1)
+        if isinstance(centers, DGBCoords):
+            centers = centers.centers
+        centers = np.asanyarray(centers)
+        masses = np.asanyarray(masses)
+        # nearest-neighbor queries on a k-d tree avoid building the (N, N) distance matrix at all
+        tree = sp.spatial.cKDTree(centers)
+        npts = len(centers)
+        closest = np.full(npts, np.inf)
+        todo = np.arange(npts)
+        k = min(2, npts)
+        while len(todo) > 0:
+            dists, _ = tree.query(centers[todo], k=k)
+            dists = dists.reshape(len(todo), -1)
+            # exclude (near-)duplicates with a masked reduction, like the zero self-distance
+            found = np.min(dists, axis=1, where=dists >= 1e-8, initial=np.inf)
+            closest[todo] = found
+            if k == npts:
+                break
+            # only points whose k nearest are all duplicates need a wider search
+            todo = todo[np.isinf(found)]
+            k = min(2 * k, npts)
+        if np.isinf(closest).any():
+            closest[np.isinf(closest)] = np.max(sp.spatial.distance.pdist(centers)) if npts > 1 else 0
         # too hard to compute convex hull for now...so we treat the exterior
         # the same as the interior
         a = scaling * np.sqrt(masses[np.newaxis, :] / closest[:, np.newaxis])
         if use_mean:
             a = np.mean(a)
-        # print("???", a[:5])
         return a
 
     # TODO: add method to rotate to point along bonds
@@ -1052,7 +1090,7 @@ class DGBGaussians:
             np.flip(np.asarray(sp.special.hermite(coeff_dict.get(k, 0), monic=False)))
             * np.sqrt(
                 (2 * alphas[k] ) ** np.arange(coeff_dict.get(k, 0)+1)
-                / ( 2**(coeff_dict.get(k, 0)) * np.math.factorial(coeff_dict.get(k, 0)) )
+                / ( 2**(coeff_dict.get(k, 0)) * math.factorial(coeff_dict.get(k, 0)) )
             )
             for k in range(ndim)
         ]
@@ -1078,6 +1116,11 @@ class DGBGaussians:
     @transformations.setter
     def transformations(self, tf):
         self._transforms = self.canonicalize_transforms(self.alphas, tf)
+        # everything cached downstream of the overlap Gaussians is now stale
+        self._overlap_data = None
+        self._pref = None
+        self._S = None
+        self._T = None
     @classmethod
     def canonicalize_transforms(self, coords, tfs):
         npts = coords.shape[0]
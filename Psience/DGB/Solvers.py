@@ -4,9 +4,16 @@ import numpy as np, scipy as sp, collections
 class DGBEigensolver:
 
     @classmethod
-    def get_orthogonal_transform(self, S, min_singular_value=None, subspace_size=None):
+    def get_overlap_eigensystem(cls, S):
+        # divide-and-conquer is the fastest full symmetric solver and S is never partially needed
+        return sp.linalg.eigh(S, driver='evd', check_finite=False)
 
-        sig, evecs = np.linalg.eigh(S)
+    @classmethod
+    def get_orthogonal_transform(self, S, min_singular_value=None, subspace_size=None, S_eigs=None):
+
+        if S_eigs is None:
+            S_eigs = self.get_overlap_eigensystem(S)
+        sig, evecs = S_eigs
 
         # we'll ignore anything too large?
         # and anything negative?
@@ -37,7 +44,7 @@ class DGBEigensolver:
         if L.shape[0] == L.shape[1]: # no contraction
             return Q, Qinv, None
 
-        Qe, QL = np.linalg.eigh(Q)
+        Qe, QL = sp.linalg.eigh(Q, driver='evd', check_finite=False)
         qsub = np.where(Qe > 1e-8)[0]
         Qq = QL[:, qsub]
         qrest = np.where(Qe <= 1e-8)[0]
@@ -51,31 +58,50 @@ class DGBEigensolver:
                             hamiltonian,
                             min_singular_value=None,
                             subspace_size=None,
-                            nodeless_ground_state=False
+                            nodeless_ground_state=False,
+                            num_states=None,
+                            S_eigs=None
                             ):
+        # when only the lowest few states are requested we let LAPACK
+        # compute just that subset instead of the full spectrum
+        if num_states is not None:
+            num_states = min(num_states, len(H))
+            subset_opts = dict(subset_by_index=[0, num_states - 1])
+        else:
+            subset_opts = {}
+
+        if S_eigs is None:
+            # decompose S once, the nodeless ground-state search below reuses it for each subspace
+            S_eigs = self.get_overlap_eigensystem(S)
         Q, Qinv, proj = self.get_orthogonal_transform(
             S,
             min_singular_value=min_singular_value,
-            subspace_size=subspace_size
+            subspace_size=subspace_size,
+            S_eigs=S_eigs
         )
 
         if proj is None:
             # print(Q.shape, H.shape, self.S.shape, self.centers.shape)
-            eigs, evecs = sp.linalg.eigh(H, S)
-            Qq = np.eye(len(Q))
+            # H and S are the cached Hamiltonian matrices so we can't let LAPACK overwrite them
+            eigs, evecs = sp.linalg.eigh(H, S,
+                                         driver='gvx' if num_states is not None else 'gvd',
+                                         check_finite=False,
+                                         **subset_opts
+                                         )
+            subspace_dim = len(Q)
         else:
             Qq, Qqinv = proj
-            hamiltonian.logger.log_print('solving with subspace size {}'.format(Qq.shape[1]))
+            subspace_dim = Qq.shape[1]
+            hamiltonian.logger.log_print('solving with subspace size {}'.format(subspace_dim))
             Hq = Qq.T @ Q @ H @ Q.T @ Qq  # in our projected orthonormal basis
-            eigs, evecs = np.linalg.eigh(Hq)
-            evecs = np.concatenate(
-                [
-                    evecs,
-                    np.zeros((Qqinv.shape[1] - Qq.shape[1], len(evecs)))
-                ],
-                axis=0
-            )
-            evecs = Q.T @ Qqinv.T @ evecs
+            if num_states is not None:
+                subset_opts['subset_by_index'][1] = min(num_states, Hq.shape[0]) - 1
+                eigs, evecs = sp.linalg.eigh(Hq, driver='evr', check_finite=False, overwrite_a=True, **subset_opts)
+            else:
+                eigs, evecs = sp.linalg.eigh(Hq, driver='evd', check_finite=False, overwrite_a=True)
+            # padding with zeros and applying `Qqinv.T` only ever picks up its leading
+            # `subspace_dim` columns, which are exactly `Qq`
+            evecs = Q.T @ (Qq @ evecs)
         if nodeless_ground_state:
             from .Wavefunctions import DGBWavefunctions
             # fast enough if we have not that many points...
@@ -84,16 +110,18 @@ class DGBEigensolver:
             abs_gs = np.abs(gs)
             signs = np.sign(gs[abs_gs > np.max(abs_gs) * 1e-1])
             diffs = np.abs(np.diff(signs))
-            # print(gs[np.argsort(np.abs(gs))][-5:], Qq.shape[1] - 1)
+            # print(gs[np.argsort(np.abs(gs))][-5:], subspace_dim - 1)
             if np.sum(diffs) > 0:  # had a sign flip
                 if subspace_size is not None:
-                    subspace_size = min(subspace_size, Qq.shape[1])
+                    subspace_size = min(subspace_size, subspace_dim)
                 else:
-                    subspace_size = Qq.shape[1]
+                    subspace_size = subspace_dim
                 eigs, evecs = self.classic_eigensolver(
                     H, S, hamiltonian,
                     subspace_size=subspace_size - 1,
-                    nodeless_ground_state=subspace_size > 1  # gotta bottom out some time...
+                    nodeless_ground_state=subspace_size > 1,  # gotta bottom out some time...
+                    num_states=num_states,
+                    S_eigs=S_eigs
                 )
         return eigs, evecs
 
@@ -352,13 +380,100 @@ class DGBEigensolver:
         return engs, Q
 
     @classmethod
-    def fix_heiberger(self, H, S, hamiltonian, eps=1e-5):
+    def symmetric_congruence(cls, A, Q):
+        """
+        Evaluates `Q.T @ A @ Q` for symmetric `A`, letting BLAS exploit the symmetry
+        of `A` for the first product
+
+        :param A:
+        :type A: np.ndarray
+        :param Q:
+        :type Q: np.ndarray
+        :return:
+        :rtype: np.ndarray
+        """
+        if A.dtype != np.float64 or Q.dtype != np.float64:
+            return Q.T @ A @ Q
+        AQ = sp.linalg.blas.dsymm(1.0, A, Q)
+        return sp.linalg.blas.dgemm(1.0, Q, AQ, trans_a=1)
+
+    @classmethod
+    def symmetric_schur_complement(cls, A, Bs):
+        """
+        Evaluates `A - Bs.T @ Bs` for symmetric `A` as a single rank-k update,
+        only the upper triangle of the result is filled in.
+        For `A - B @ diag(dinv) @ B.T` with positive `dinv` pass `Bs = sqrt(dinv)[:, None] * B.T`.
+
+        :param A:
+        :type A: np.ndarray
+        :param Bs:
+        :type Bs: np.ndarray
+        :return:
+        :rtype: np.ndarray
+        """
+        if A.dtype != np.float64 or Bs.dtype != np.float64:
+            return A - Bs.T @ Bs
+        # `Bs` is usually a scaled transpose and so Fortran-ordered, `trans=1` avoids a copy
+        return sp.linalg.blas.dsyrk(-1.0, Bs, beta=1.0, c=A.copy(order='F'), trans=1, overwrite_c=True)
+
+    @classmethod
+    def rank_revealing_qr(cls, A):
+        """
+        Column-pivoted QR of `A`, the numerical rank is read off the diagonal of `R`
+        with the same tolerance `np.linalg.matrix_rank` applies to singular values
+
+        :param A:
+        :type A: np.ndarray
+        :return: `Q`, `R`, the column pivots, and the rank
+        :rtype: tuple
+        """
+        # A is usually a view into a matrix we still need, so LAPACK gets its own Fortran-ordered copy
+        Q, R, piv = sp.linalg.qr(A.copy(order='F'), mode='full', pivoting=True, overwrite_a=True, check_finite=False)
+        r = np.abs(np.diag(R))
+        if len(r) == 0:
+            return Q, R, piv, 0
+        tol = r[0] * max(A.shape) * np.finfo(R.dtype).eps
+        return Q, R, piv, int(np.sum(r > tol))
+
+    gpu_eigensolver_threshold = None # opt-in size above which the reduced problems go to CuPy
+    @classmethod
+    def get_gpu_eigensystem(cls, A, lower=True):
+        try:
+            import cupy
+        except ImportError:
+            return None
+        eigs, evecs = cupy.linalg.eigh(cupy.asarray(A), UPLO='L' if lower else 'U')
+        return cupy.asnumpy(eigs), cupy.asnumpy(evecs)
+
+    @classmethod
+    def get_reduced_eigensystem(cls, A, num_states=None, lower=True):
+        threshold = cls.gpu_eigensolver_threshold
+        if threshold is not None and len(A) >= threshold:
+            # cuSOLVER has no index-ranged driver, so we solve fully and truncate
+            res = cls.get_gpu_eigensystem(A, lower=lower)
+            if res is not None:
+                eigs, evecs = res
+                if num_states is not None:
+                    eigs = eigs[:num_states]
+                    evecs = evecs[:, :num_states]
+                return eigs, evecs
+
+        # the reduced problems are temporaries, so LAPACK is free to overwrite them
+        if num_states is None:
+            return sp.linalg.eigh(A, lower=lower, driver='evd', check_finite=False, overwrite_a=True)
+        num_states = min(num_states, len(A))
+        return sp.linalg.eigh(A, lower=lower, driver='evr', check_finite=False, overwrite_a=True,
+                              subset_by_index=[0, num_states - 1])
+
+    @classmethod
+    def fix_heiberger(self, H, S, hamiltonian, eps=1e-5, num_states=None):
         # raise NotImplementedError("I think my Fix-Heiberger is broken?"
         #                           "And also potentially not even the right algorithm for this problem"
         #                           "Like I potentially _want_ a large epsilon since I want to get the best"
         #                           "possible energies, but Fix-Heiberger will call that unstable I think")
 
-        d, Q = np.linalg.eigh(S)
+        S_eigs = self.get_overlap_eigensystem(S)
+        d, Q = S_eigs
         d = np.flip(d)
         Q = np.flip(Q, axis=1)
 
@@ -371,8 +486,8 @@ class DGBEigensolver:
         n2 = N - n1
 
         if n2 == 0:
-            print("Falling back on classic method...")
-            return self.classic_eigensolver(H, S, hamiltonian)
+            hamiltonian.logger.log_print("Falling back on classic method...")
+            return self.classic_eigensolver(H, S, hamiltonian, S_eigs=S_eigs, num_states=num_states)
 
         # D = np.diag(d[g1])
         # F = np.diag(d[g2])
@@ -380,13 +495,17 @@ class DGBEigensolver:
         #     d[g1],
         #     np.zeros(n2)
         # ]))
-        R = np.diag(np.concatenate([
+        # R is diagonal, so we apply it as a row/column scaling rather than two dense matmuls
+        r = np.concatenate([
             1 / np.sqrt(d[g1]),
             np.ones(n2)
-        ]))
+        ])
         # with np.printoptions(linewidth=1e8):
         #     raise Exception(R@B0@R)
-        A1 = R.T @ Q.T @ H @ Q @ R
+        A1 = self.symmetric_congruence(H, Q)
+        A1 *= r[:, np.newaxis]
+        A1 *= r[np.newaxis, :]
+        QR = Q * r[np.newaxis, :]
 
         A22 = A1[n1:, n1:]
         d2, Q22 = np.linalg.eigh(A22)
@@ -401,40 +520,45 @@ class DGBEigensolver:
             if n1 <= n2:
                 raise ValueError("singular problem (case 2)")
             A12 = A1[:n1, n1:]
-            Q12, R13 = np.linalg.qr(A12, mode='complete')
+            # A2 below relies on the unpivoted factorization, so this one keeps the SVD rank check
+            # A12 is a view into A1, so LAPACK gets its own Fortran-ordered copy to overwrite
+            Q12, R13 = sp.linalg.qr(A12.copy(order='F'), mode='full', overwrite_a=True, check_finite=False)
             if np.linalg.matrix_rank(A12) < n2:  # singular
                 raise ValueError("singular problem (case 3)")
 
             # print("N3 = 0???")
 
-            Q2 = np.eye(N)
-            Q2[:n1, :n1] = Q12
-            A2 = Q2.T @ A1 @ Q2.T
+            # Q2 = diag(Q12, I), so `Q2.T @ A1 @ Q2.T` only mixes the leading n1 rows/columns
+            # and we only need its leading n1 columns below
+            A2 = np.empty((N, n1), dtype=A1.dtype)
+            A2[:n1] = Q12.T @ A1[:n1, :n1] @ Q12.T
+            A2[n1:] = A1[n1:, :n1] @ Q12.T
 
             A12 = A2[:n2, n2:n1]
             A13 = A2[n1:, :n2]
             A22 = A2[n2:n1, n2:n1]
 
-            eigs, U2 = np.linalg.eigh(A22)
-            U1 = np.zeros((n2, n1 - n2))
-            U3 = -np.linalg.inv(A13) @ A12 @ U2
+            eigs, U2 = self.get_reduced_eigensystem(A22.copy(), num_states=num_states)
+            U3 = -np.linalg.solve(A13, A12 @ U2)
 
-            U = np.concatenate(
-                [
-                    U1, U2, U3
-                ],
-                axis=0
-            )
-
-            evecs = Q @ R @ Q2 @ U
+            # Q2 is the identity outside the leading block, so we only rotate that part of U
+            # before the single N x k product with QR, and since the U1 block is zero only
+            # the columns of Q12 that act on U2 contribute
+            U = np.empty((N, U2.shape[1]), dtype=U2.dtype)
+            U[:n1] = Q12[:, n2:] @ U2
+            U[n1:] = U3
+            evecs = QR @ U
 
         else:
 
             g4 = np.where(d2 < cut2)[0]
             n4 = len(g4)
-            Q2 = np.eye(N)
-            Q2[n1:, n1:] = Q22
-            A2 = Q2.T @ A1 @ Q2
+            # Q2 = diag(I, Q22) is the identity outside the lower block, so only the blocks touching it change
+            A2 = A1.copy()
+            A2[:n1, n1:] = A1[:n1, n1:] @ Q22
+            A2[n1:, :n1] = A2[:n1, n1:].T
+            # Q22 diagonalizes A22, so the congruence is just D2 (and the partitions below never read it)
+            A2[n1:, n1:] = np.diag(d2)
             # B2 = Q2.T@B1@Q2
 
             if n4 == 0:
@@ -442,43 +566,47 @@ class DGBEigensolver:
                 # print("N4 = 0??? {d2}".format(d2=d2))
                 A11 = A2[:n1, :n1]
                 A12 = A2[:n1, n1:]
-                Dinv = np.diag(1 / d2)
-
-                eigs, U1 = np.linalg.eigh(A11 - A12 @ Dinv @ A12.T)
-                U2 = -Dinv @ A12.T @ U1
-
-                U = np.concatenate(
-                    [
-                        U1, U2
-                    ],
-                    axis=0
+                # every retained D2 eigenvalue is above `cut2 > 0`, so the scaling is real
+                # and one sqrt(D2)^-1 scaled block serves both the Schur complement and U2
+                dinv_sqrt = 1 / np.sqrt(d2)
+                A12s = dinv_sqrt[:, np.newaxis] * A12.T
+
+                eigs, U1 = self.get_reduced_eigensystem(
+                    self.symmetric_schur_complement(A11, A12s),
+                    num_states=num_states,
+                    lower=False
                 )
+                U2 = -dinv_sqrt[:, np.newaxis] * (A12s @ U1)
 
-                evecs = Q @ R @ Q2 @ U
+                U = np.empty((N, U1.shape[1]), dtype=U1.dtype)
+                U[:n1] = U1
+                U[n1:] = Q22 @ U2
+                evecs = QR @ U
             else:  # second iteration of this partitioning...
                 if n1 <= n4:
                     raise ValueError("singular problem (case 5)")
 
-                A2[-n4:, -n4:] = np.zeros((n4, n4))  #
+                A2[-n4:, -n4:] = 0
                 # B2 = B1
 
                 A13 = A2[:n1, n1 + n3:]
-                Q33, R14 = np.linalg.qr(A13, mode='complete')
-                if np.linalg.matrix_rank(A13) < n4:  # singular
+                Q33, R14, piv14, rank14 = self.rank_revealing_qr(A13)
+                if rank14 < n4:  # singular
                     raise ValueError("singular problem (case 6)")
-                # A14 = R14[:n4]
 
-                Q3 = np.eye(N)
-                Q3[:n1, :n1] = Q33
-                A3 = Q3.T @ A2 @ Q3
+                # Q3 only mixes the leading n1 rows/columns and A3 stays symmetric, so we fill the
+                # leading block by a symmetric congruence and mirror the off-diagonal block
+                A3 = A2.copy()
+                A3[:n1, :n1] = self.symmetric_congruence(A2[:n1, :n1], Q33)
+                A3[:n1, n1:] = Q33.T @ A2[:n1, n1:]
+                A3[n1:, :n1] = A3[:n1, n1:].T
 
                 # B3 = B1
 
                 n5 = n1 - n4
                 A11 = A3[:n4, :n4]
-                A12 = A3[:n4, n4:n1]
-                A13 = A3[:n4, n1:n1 + n3]
-                A14 = A3[:n4, -n4:]
+                # A12 and A13 are adjacent column blocks, so we keep them together for the U4 solve
+                A12_13 = A3[:n4, n4:n1 + n3]
 
                 A22 = A3[n4:n1, n4:n1]
                 A23 = A3[n4:n1, n1:n1 + n3]
@@ -486,22 +614,30 @@ class DGBEigensolver:
                 #
                 # raise Exception(A24)
 
-                Dinv = np.diag(1 / d2[g3])
+                dinv_sqrt = 1 / np.sqrt(d2[g3])
+                A23s = dinv_sqrt[:, np.newaxis] * A23.T
 
-                U1 = np.zeros((n4, n5))
-                eigs, U2 = np.linalg.eigh(
-                    A22 - A23 @ Dinv @ A23.T
+                eigs, U2 = self.get_reduced_eigensystem(
+                    self.symmetric_schur_complement(A22, A23s),
+                    num_states=num_states,
+                    lower=False
                 )
-                U3 = -Dinv @ A23.T @ U2
-                U4 = -np.linalg.inv(A14) @ (A12 @ U2 + A13 @ U3)
-
-                U = np.concatenate(
-                    [
-                        U1, U2, U3, U4
-                    ],
-                    axis=0
+                U23 = np.empty((n5 + n3, U2.shape[1]), dtype=U2.dtype)
+                U23[:n5] = U2
+                U23[n5:] = -dinv_sqrt[:, np.newaxis] * (A23s @ U2)
+                U3 = U23[n5:]
+                # A14 = R14[:n4] P^T, so we back-substitute against R and undo the column pivots
+                U4 = np.empty((n4, U2.shape[1]), dtype=U2.dtype)
+                U4[piv14] = -sp.linalg.solve_triangular(
+                    R14[:n4], A12_13 @ U23,  # A12 @ U2 + A13 @ U3 in a single product
+                    overwrite_b=True, check_finite=False
                 )
 
-                evecs = Q @ R @ Q2 @ Q3 @ U
+                # apply the block rotations right-to-left against the thin U, writing each
+                # rotated block straight into place and skipping the zero U1 block
+                U = np.empty((N, U2.shape[1]), dtype=U2.dtype)
+                U[:n1] = Q33[:, n4:] @ U2
+                U[n1:] = Q22[:, :n3] @ U3 + Q22[:, n3:] @ U4
+                evecs = QR @ U
 
         return eigs, evecs
\ No newline at end of file
@@ -1,4 +1,5 @@
 
+import math
 import numpy as np
 from McUtils.Scaffolding import ParameterManager
 
@@ -22,15 +23,26 @@ class DVRConstructor:
             None: CartesianDVR
         }
     @classmethod
+    def get_domain_map(cls):
+        # memoized per class, so subclasses can register their own domains through `load_domain_map`
+        domain_map = cls.__dict__.get('_domain_map')
+        if domain_map is None:
+            domain_map = cls.load_domain_map()
+            cls._domain_map = domain_map
+        return domain_map
+    @classmethod
     def infer_DVR_type(cls, domain):
-        if cls._domain_map is None:
-            cls._domain_map = cls.load_domain_map()
-        for k,v in cls._domain_map.items():
+        domain_map = cls.get_domain_map()
+        dmin, dmax = float(domain[0]), float(domain[1])
+        for k,v in domain_map.items():
             if k is not None:
-                if np.allclose(k, domain):
+                if (
+                        math.isclose(dmin, k[0], rel_tol=1e-5, abs_tol=1e-8)
+                        and math.isclose(dmax, k[1], rel_tol=1e-5, abs_tol=1e-8)
+                ):
                     return v
         else:
-            return cls._domain_map[None]
+            return domain_map[None]
 
     @classmethod
     def construct(cls,
@@ -73,14 +85,12 @@ class DVRConstructor:
         if isinstance(po_divs, int):
             po_divs = [po_divs]*len(mass)
 
-        ndim = len(list(zip(domain, divs, classes, mass, subg, g_deriv)))
+        # zip the per-axis specs once and resolve each axis' DVR class up front
+        axes = list(zip(domain, divs, classes, mass, subg, g_deriv, po_divs))
+        ndim = len(axes)
+        types = [cls.infer_DVR_type(r) if c is None else c for r, n, c, m, sg, gd, nwf in axes]
         if ndim == 1:
-            classes = [
-                cls.infer_DVR_type(r) if c is None else c
-                for r, n, c, m, sg, gd, nwf in zip(domain, divs, classes, mass, subg, g_deriv, po_divs)
-            ]
-
-            dvr = classes[0](
+            dvr = types[0](
                 domain=domain[0],
                 divs=divs[0],
                 potential_function=potential_function,
@@ -92,8 +102,8 @@ class DVRConstructor:
             )
         else:
             dvrs_1D = [
-                cls.infer_DVR_type(r)(domain=r, divs=n, mass=m, g=sg, g_deriv=gd, num_wfns=nwf) if c is None else c(domain=r, divs=n)
-                for r, n, c, m, sg, gd, nwf in zip(domain, divs, classes, mass, subg, g_deriv, po_divs)
+                t(domain=r, divs=n, mass=m, g=sg, g_deriv=gd, num_wfns=nwf) if c is None else t(domain=r, divs=n)
+                for t, (r, n, c, m, sg, gd, nwf) in zip(types, axes)
             ]
             dvr = DirectProductDVR(
                 dvrs_1D,
@@ -14,6 +14,10 @@ __all__ = [
     "SphericalDVR"
 ]
 
+def _kron_csr(a, b):
+    '''Kronecker product kept in CSR form so the reductions never pass through BSR/COO intermediates'''
+    return sp.kron(a, b, format='csr')
+
 class DirectProductDVR(BaseDVR):
     def __init__(self,
                  dvrs_1D,
@@ -120,10 +124,10 @@ class DirectProductDVR(BaseDVR):
                 '''Computes a Kronecker sum to build our Kronecker-Delta tensor product expression'''
                 n_1 = a.shape[0]
                 n_2 = b.shape[0]
-                ident_1 = sp.identity(n_1)
-                ident_2 = sp.identity(n_2)
+                ident_1 = sp.identity(n_1, format='csr')
+                ident_2 = sp.identity(n_2, format='csr')
 
-                return sp.kron(a, ident_2) + sp.kron(ident_1, b)
+                return _kron_csr(a, ident_2) + _kron_csr(ident_1, b)
 
             ke = reduce(_kron_sum, kes)
         else:
@@ -143,9 +147,9 @@ class DirectProductDVR(BaseDVR):
 
                     # construct the basic kinetic energy kronecker product
                     sub_kes = [  # set up all the subtensors we'll need for this
-                        sp.eye(tot_shape[k]) if k != i else kes[k] for k in range(ndim)
+                        sp.eye(tot_shape[k], format='csr') if k != i else kes[k] for k in range(ndim)
                     ]
-                    ke_mat = reduce(sp.kron, sub_kes)
+                    ke_mat = reduce(_kron_csr, sub_kes)
 
                     # now we need to figure out where to multiply in the g_vals
                     flat_rows, flat_cols, ke_vals = sp.find(ke_mat)
@@ -197,10 +201,10 @@ class DirectProductDVR(BaseDVR):
 
                             # construct the basic momenta Kroenecker product
                             sub_momenta = [  # set up all the subtensors we'll need for this
-                                sp.eye(tot_shape[k]) if k != i and k != j else sp.csr_matrix(momenta[k])
+                                sp.eye(tot_shape[k], format='csr') if k != i and k != j else sp.csr_matrix(momenta[k])
                                 for k in range(len(momenta))
                             ]
-                            momentum_mat = reduce(sp.kron, sub_momenta)
+                            momentum_mat = reduce(_kron_csr, sub_momenta)
 
                             # now we need to figure out where to multiply in the ij_vals
                             flat_rows, flat_cols, mom_prod_vals = sp.find(momentum_mat)
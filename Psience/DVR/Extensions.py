@@ -15,17 +15,25 @@ __all__ = [
 ]
 
 class SCFWavefunctionGenerator:
+    __slots__ = ('dvr', 'prev', '_grid', '_ke')
     def __init__(self, dvr_1D:BaseDVR):
         self.dvr = dvr_1D
         self.prev = None
+        self._grid = None
+        self._ke = None
     def __call__(self, pot, **kwargs):
+        run = self.dvr.run
         if self.prev is None:
-            res = self.prev = self.dvr.run(potential_values=pot)
+            res = self.prev = run(potential_values=pot)
+            self._grid = res.grid
+            self._ke = res.kinetic_energy
         else:
-            res = self.dvr.run(
+            # the grid and kinetic matrix are fixed across SCF iterations, only the potential
+            # (and so the Hamiltonian each result keeps) has to be rebuilt
+            res = run(
                 potential_values=pot,
-                grid=self.prev.grid,
-                kinetic_energy=self.prev.kinetic_energy
+                grid=self._grid,
+                kinetic_energy=self._ke
             )
         return res.wavefunctions
 
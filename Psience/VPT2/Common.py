@@ -1,5 +1,7 @@
 
 import numpy as np
+import McUtils.Misc as mcmisc
+from McUtils.Numputils import SparseArray, ScipySparseArray
 
 __all__ = [
     "PerturbationTheoryException",
@@ -11,8 +13,34 @@ class PerturbationTheoryException(Exception):
 class Settings:
     non_zero_cutoff = 1.0e-14
 
-def _safe_dot(a, b):
+@mcmisc.njit(parallel=True, cache=True)
+def _csr_matmat(data, indices, indptr, B, out):
+    for i in mcmisc.prange(len(indptr) - 1):
+        for idx in range(indptr[i], indptr[i+1]):
+            out[i] += data[idx] * B[indices[idx]]
+    return out
+
+def _csr_dense_dot(a, b):
+    # for the plain 2D CSR x dense case we hand the raw CSR buffers straight to a threaded kernel
+    # instead of going through the general `SparseArray.dot` reshaping machinery
+    if not hasattr(_csr_matmat, 'py_func'): # numba unavailable, scipy's compiled path is faster
+        return None
+    if not (
+            isinstance(a, ScipySparseArray)
+            and isinstance(b, np.ndarray) and b.ndim == 2
+            and len(a.shape) == 2 and a.data.shape == a.shape
+            and a.data.format == 'csr'
+    ):
+        return None
+    m = a.data
+    dtype = np.result_type(m.dtype, b.dtype)
+    out = np.zeros((m.shape[0], b.shape[1]), dtype=dtype)
+    return _csr_matmat(m.data, m.indices, m.indptr, np.ascontiguousarray(b, dtype=dtype), out)
+
+def _safe_dot(a, b, csr_kernel=True):
     # generalizes the dot product so that we can use 0 as a special value...
+    # `csr_kernel=False` skips the numba kernel, which can't be launched concurrently
+    # from several threads under every numba threading layer
     if (
             isinstance(a, (int, np.integer, float, np.floating)) and a == 0
             or isinstance(b, (int, np.integer, float, np.floating)) and b == 0
@@ -22,7 +50,9 @@ def _safe_dot(a, b):
     if isinstance(a, np.ndarray):
         doots = np.dot(a, b)
     else:
-        doots = a.dot(b)
+        doots = _csr_dense_dot(a, b) if csr_kernel else None
+        if doots is None:
+            doots = a.dot(b)
 
     if isinstance(b, np.ndarray) and isinstance(doots, SparseArray):
         doots = doots.asarray()
@@ -1,5 +1,5 @@
 
-import numpy as np, itertools
+import numpy as np, itertools, concurrent.futures
 
 from McUtils.Numputils import SparseArray
 import McUtils.Numputils as nput
@@ -58,6 +58,7 @@ class PerturbationTheoryCorrections:
         self.energy_corrs = energy_corrs
         self.all_energy_corrs = all_energy_corrections
         self.wfn_corrections = wfn_corrections
+        self._wfn_csr = None
         self.degenerate_states = degenerate_states
         self.degenerate_transf = degenerate_transformation
         self.degenerate_energies = degenerate_energies
@@ -130,7 +131,28 @@ class PerturbationTheoryCorrections:
         if self.degenerate:
             return self.degenerate_energies
         else:
-            return np.sum(self.energy_corrs, axis=1)
+            # the sum is cached until `energy_corrs` is reassigned, and handed
+            # out read-only so callers can't corrupt it for later reads
+            engs = self._energies
+            if engs is None:
+                engs = self._energies = np.sum(self.energy_corrs, axis=1)
+                engs.setflags(write=False)
+            return engs
+
+    @property
+    def energy_corrs(self):
+        """
+        The per-order energy corrections, reassign (rather than modify in place)
+        to have `energies` pick up the change
+
+        :return:
+        :rtype: np.ndarray
+        """
+        return self._energy_corrs
+    @energy_corrs.setter
+    def energy_corrs(self, corrs):
+        self._energy_corrs = corrs
+        self._energies = None
 
     @property
     def order(self):
@@ -150,14 +172,22 @@ class PerturbationTheoryCorrections:
         :rtype:
         """
 
-        new_states = self.states.find(space)
+        new_states = np.asarray(self.states.find(space))
         # print("? =", new_states)
+        # row selections on the cached CSR forms avoid building COO data per order
+        wfn_corrections = []
+        for k, w in enumerate(self.wfn_corrections):
+            csr = self._correction_csr(k)
+            if csr is None:
+                wfn_corrections.append(w[new_states, :])
+            else:
+                wfn_corrections.append(nput.ScipySparseArray(csr[new_states]))
         return type(self)(
             self.states.take_subspace(new_states),
             self.coupled_states.take_states(space),
             self.total_basis,
             self.energy_corrs[new_states],
-            [w[new_states, :] for w in self.wfn_corrections],
+            wfn_corrections,
             # not sure what to do with all this...
             degenerate_states=self.degenerate_states,
             degenerate_transformation=self.degenerate_transf,
@@ -329,8 +359,31 @@ class PerturbationTheoryCorrections:
             sp_inds = tuple(s[mask] for s in sp_inds)
             self.wfn_corrections[o].block_vals = sp_vals
             self.wfn_corrections[o].block_inds = sp_inds
+        self._wfn_csr = None
         return self
 
+    def _correction_csr(self, k):
+        """
+        Returns (and caches) the CSR form of the `k`-th order correction
+        so that column selections and products stay sparse
+
+        :param k:
+        :type k: int
+        :return:
+        :rtype: sp.csr_matrix | None
+        """
+        w = self.wfn_corrections[k]
+        if not hasattr(w, 'ascsr') or len(w.shape) != 2:
+            return None
+        cache = getattr(self, '_wfn_csr', None)
+        if cache is None:
+            cache = self._wfn_csr = {}
+        key, csr = cache.get(k, (None, None))
+        if key is not w:
+            csr = w.ascsr()
+            cache[k] = (w, csr)
+        return csr
+
     def _take_subham(self, rep, inds):
         """
         Builds a subsampled version of a representation Hamiltonian
@@ -679,7 +732,8 @@ class PerturbationTheoryCorrections:
     def operator_representation(self, operator_expansion,
                                 order=None, subspace=None, contract=True,
                                 logger_symbol="A",
-                                logger_conversion=None
+                                logger_conversion=None,
+                                threads=None
                                 ):
         """
         Generates the representation of the operator in the basis of stored states
@@ -690,6 +744,8 @@ class PerturbationTheoryCorrections:
         :type order: Iterable[float] | Iterable[np.ndarray]
         :param subspace: the subspace of terms in which the operator expansion is defined
         :type subspace: None | BasisStateSpace
+        :param threads: the number of threads to use to evaluate the independent products
+        :type threads: None | int
         :return: the set of representation matrices for this operator
         :rtype: Iterable[np.ndarray]
         """
@@ -715,45 +771,102 @@ class PerturbationTheoryCorrections:
             subspace_sel = self.total_basis.find(subspace, check=True)
             wfn_corrs = []
             for k in range(order):
-                wfn_corrs.append(self.wfn_corrections[k][:, subspace_sel])
+                csr = self._correction_csr(k)
+                if csr is None:
+                    wfn_corrs.append(self.wfn_corrections[k][:, subspace_sel])
+                else:
+                    wfn_corrs.append(nput.ScipySparseArray(csr[:, subspace_sel]))
 
         # generalizes the dot product so that we can use 0 as a special value...
         dot = _safe_dot
         logger = self.logger
         logger = None if logger is None or isinstance(logger, NullLogger) else logger
 
-        # does the dirty work of acutally applying the rep...
-        reps = [[] for _ in range(order)]
-        full_ops = []
-        for k in range(order):
-            tags = []
-            op = []
-            # apply each thing up to requested order...
-            for a in range(k+1): # if k == 2: a=0, a=1, a=2
-                for b in range(k-a+1): # if k==2, a==0: b=0, b=1, b=2; a==1: b=0, b=1
-                    c = k - (a + b) # a + b + c == k
-                    rop = operator_expansion[c]
-                    if isinstance(rop, (int, float, np.integer, np.floating)): # constant reps...
-                        if rop != 0: # cheap easy check
-                            subrep = rop * dot(wfn_corrs[a], wfn_corrs[b].T)
-                            op.append(subrep)
-                        else:
-                            subrep = 0
-                            op.append(0)
-                    else:
-                        subrep = dot(dot(wfn_corrs[a], rop), wfn_corrs[b].T)
-                        op.append(subrep)
+        # the same (a, c) left products and (a, b) overlaps recur across orders,
+        # so we transpose the corrections once and share those intermediates
+        wfn_corrs_T = [w.T for w in wfn_corrs]
+        # operator terms that vanish identically never need their products formed
+        zero_ops = [
+            rop == 0 if isinstance(rop, (int, float, np.integer, np.floating))
+            else not rop.any() if isinstance(rop, np.ndarray)
+            else getattr(rop, 'non_zero_count', None) == 0
+            for rop in operator_expansion[:order]
+        ]
+        const_ops = [
+            isinstance(rop, (int, float, np.integer, np.floating))
+            for rop in operator_expansion[:order]
+        ]
+        nstates = wfn_corrs[0].shape[0]
+        def _zero_term(c):
+            # a vanishing constant term is a plain 0 but a vanishing matrix term
+            # still gives a (zero) matrix, as if its products had been formed
+            if const_ops[c]:
+                return 0
+            return np.zeros((nstates, nstates), dtype=getattr(operator_expansion[c], 'dtype', float))
+
+        # the (a, b, c) terms, a + b + c == k, at every order
+        terms = [
+            [(a, b, k - (a + b)) for a in range(k+1) for b in range(k-a+1)]
+            for k in range(order)
+        ]
+        # every term sharing an (a, c) left product or an (a, b) overlap is formed
+        # in one task, so each intermediate is dropped as soon as its terms are done
+        def _left_terms(a, c):
+            left = dot(wfn_corrs[a], operator_expansion[c])
+            return [((a, b, c), dot(left, wfn_corrs_T[b])) for b in range(order - (a + c))]
+        def _overlap_terms(a, b):
+            overlap = dot(wfn_corrs[a], wfn_corrs_T[b])
+            return [
+                ((a, b, c), operator_expansion[c] * overlap)
+                for c in range(order - (a + b)) if const_ops[c] and not zero_ops[c]
+            ]
+        tasks = [
+            (_left_terms, a, c)
+            for a in range(order) for c in range(order - a)
+            if not (zero_ops[c] or const_ops[c])
+        ] + [
+            (_overlap_terms, a, b)
+            for a in range(order) for b in range(order - a)
+            if any(const_ops[c] and not zero_ops[c] for c in range(order - (a + b)))
+        ]
+
+        # the products are independent and the dense/scipy ones release the GIL, so we can farm
+        # the tasks out to threads, but then the already-parallel numba CSR kernel has to stay out
+        if threads is not None and len(tasks) > 1:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+            pmap = pool.map
+            dot = lambda a, b: _safe_dot(a, b, csr_kernel=False)
+        else:
+            pool = None
+            pmap = map
 
-                    full_ops.append([
-                        (a, b, c),
-                        subrep
-                    ])
+        # does the dirty work of acutally applying the rep...
+        # when contracting we only hold on to the individual terms if we need to log them
+        subreps = {} if not contract or logger is not None else None
+        reps = [0] * order
+        try:
+            for task_terms in pmap(lambda task: task[0](*task[1:]), tasks):
+                for abc, subrep in task_terms:
+                    if contract:
+                        k = sum(abc)
+                        reps[k] = reps[k] + subrep
+                    if subreps is not None:
+                        subreps[abc] = subrep
+        finally:
+            if pool is not None:
+                pool.shutdown()
 
+        for k in range(order):
             if contract:
-                op = sum(op)
-            reps[k] = op
-
+                if isinstance(reps[k], int): # no live terms at this order
+                    reps[k] = sum(_zero_term(c) for a, b, c in terms[k])
+            else:
+                reps[k] = [subreps[abc] if abc in subreps else _zero_term(abc[2]) for abc in terms[k]]
         if logger is not None:
+            full_ops = [
+                [abc, subreps[abc] if abc in subreps else _zero_term(abc[2])]
+                for k_terms in terms for abc in k_terms
+            ]
             logger.log_print(full_ops, logger_symbol, logger_conversion, message_prepper=self._fmt_operator_rep)
 
         return reps
@@ -767,16 +880,30 @@ class PerturbationTheoryCorrections:
         :rtype:
         """
 
+        # keep the corrections sparse (the overlaps are only states x states) unless we
+        # can't, and use that the (i, k-i) and (k-i, i) terms are transposes
+        corrs = [self._correction_csr(k) for k in range(2 + 1)]
+        if any(c is None for c in corrs):
+            # densify straight from the CSR data wherever we have it
+            corrs = [
+                c.toarray() if c is not None else w.asarray()
+                for c, w in zip(corrs, self.wfn_corrections[:2 + 1])
+            ]
+        corrs_T = [c.T for c in corrs]
         wat = []
         for k in range(2 + 1):
             ov = None
-            for i in range(k + 1):
-                c1 = self.wfn_corrections[i].asarray()
-                c2 = self.wfn_corrections[k - i].asarray()
+            for i in range((k + 2) // 2):
+                prod = corrs[i] @ corrs_T[k - i]
+                if i != k - i:
+                    prod = prod + prod.T
                 if ov is None:
-                    ov = np.dot(c1, c2.T)
+                    ov = prod
                 else:
-                    ov += np.dot(c1, c2.T)
+                    ov = ov + prod
+            # sparse terms are only densified once the order is summed
+            if not isinstance(ov, np.ndarray):
+                ov = ov.toarray()
             wat.append(ov)
 
         return wat
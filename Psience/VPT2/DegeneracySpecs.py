@@ -209,22 +209,24 @@ class EnergyCutoffDegeneracySpec(DegeneracySpec):
         # so initially we pull the sets of energies
 
         diag_inds = BraKetSpace(states, states)
-        energies = H0[diag_inds, diag_inds]
+        energies = np.asarray(H0[diag_inds, diag_inds])
+        # we only want to apply this once per degenerate group, so each group is seeded by
+        # the first state not yet covered by an earlier one and takes every state in its window
+        # NOTE: this is a path to subtlety, since
+        #   if state a is within 50 cm^-1 of state b, and state b is within of c,
+        #   you might argue a and c are degenerate
+        #   we are wagering that states are distinct _enough_ such that this is not
+        #   an issue, but if it is a different strategy will be required
+        assigned = np.zeros(len(energies), dtype=bool)
         degenerate_groups = []
-        # then we look through the input states
-        for n, e in enumerate(energies):
-            # we only want to apply this once per degenerate group
-            # NOTE: this is a path to subtlety, since
-            #   if state a is within 50 cm^-1 of state b, and state b is within of c,
-            #   you might argue a and c are degenerate
-            #   we are wagering that states are distinct _enough_ such that this is not
-            #   an issue, but if it is a different strategy will be required
-            if all(n not in d for d in degenerate_groups):
-                e_diffs = np.abs(energies - e)
-                inds = np.where(e_diffs < cutoff)[0]
-                degenerate_groups.append(set(inds))
-        # raise Exception(degenerate_groups)
-        degenerate_groups = [states.take_subspace(np.array(list(d), dtype=int)) for d in degenerate_groups]
+        for n in range(len(energies)):
+            if assigned[n]:
+                continue
+            inds = np.flatnonzero(np.abs(energies - energies[n]) < cutoff)
+            assigned[inds] = True
+            assigned[n] = True
+            degenerate_groups.append(inds)
+        degenerate_groups = [states.take_subspace(d) for d in degenerate_groups]
         return degenerate_groups
 
 class MartinTestDegeneracySpec(DegeneracySpec):
@@ -647,6 +649,34 @@ class TotalQuantaDegeneracySpec(PolyadDegeneracySpec):
                 b[reduce_pos] = b[reduce_pos] - min_vals
         return a,b
 
+    @classmethod
+    def reduce_rules(cls, a, b):
+        """
+        Applies `reduce_rule` to every row pair of `a` and `b` at once
+
+        :param a:
+        :type a: np.ndarray
+        :param b:
+        :type b: np.ndarray
+        :return:
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        a = a.copy()
+        b = b.copy()
+
+        big = np.iinfo(a.dtype).max
+        m1 = np.min(np.where(a > 0, a, big), axis=1)
+        m2 = np.min(np.where(b > 0, b, big), axis=1)
+        m1, m2 = np.maximum(m1, m2), np.minimum(m1, m2)
+        div = m1 % m2 == 0
+        a[div] //= m2[div, np.newaxis]
+        b[div] //= m2[div, np.newaxis]
+        # quanta are non-negative, so the overlap min is zero wherever either side is empty
+        min_vals = np.minimum(a, b)
+        a -= min_vals
+        b -= min_vals
+        return a, b
+
     @classmethod
     def make_nt_polyad(cls, nt, target_modes=None, max_quanta=3):  # this should be of the form num of quanta give same E
         # we want to choose different subsets of the nT vector to construct rules
@@ -668,21 +698,19 @@ class TotalQuantaDegeneracySpec(PolyadDegeneracySpec):
         (keys, groups), _ = nput.group_by(states, nts)
         rules = set()
         for k,g in zip(keys, groups):
-            if k > 0:
-                for n,i in enumerate(g):
-                    for j in g[n+1:]:
-                        a, b = cls.reduce_rule(i, j)
-                        # insert zeros at dropped positions
-                        if len(target_modes) < ndim:
-                            _ = np.zeros(ndim, dtype=int)
-                            _[target_modes] = a
-                            a = _
-                            _ = np.zeros(ndim, dtype=int)
-                            _[target_modes] = b
-                            b = _
-                        a = tuple(a)
-                        b = tuple(b)
-                        rules.add((a, b))
+            if k > 0 and len(g) > 1:
+                # reduce every pair in the group at once
+                i, j = np.triu_indices(len(g), k=1)
+                a, b = cls.reduce_rules(g[i], g[j])
+                # insert zeros at dropped positions
+                if len(target_modes) < ndim:
+                    _ = np.zeros((len(a), ndim), dtype=int)
+                    _[:, target_modes] = a
+                    a = _
+                    _ = np.zeros((len(b), ndim), dtype=int)
+                    _[:, target_modes] = b
+                    b = _
+                rules.update(zip(map(tuple, a.tolist()), map(tuple, b.tolist())))
         return list(rules)
 
 class CallableDegeneracySpec(DegeneracySpec):
@@ -1047,18 +1075,17 @@ class DegenerateMultiStateSpace(BasisMultiStateSpace):
             groups = states.split(1) #[[x] for x in states.indices]  # we're gonna loop through this later so why not destructure now...
         else:
             groups = [None] * len(degenerate_states)
-            deg_sets = [(set(d.indices),d) for d in degenerate_states]
-            for x in states.indices:
-                for i, (d,bs) in enumerate(deg_sets):
-                    # if i == 11:
-                    #     raise Exception(bs.excitations, bs.indices)
-                    if x in d:
-                        if groups[i] is None:
-                            groups[i] = bs.indices
-                        # groups[i].append(x)
-                        break
-                else:
+            # map every index to the first degenerate set containing it so each state is a single lookup
+            first_group = {}
+            for i, d in enumerate(degenerate_states):
+                for x in d.indices.tolist():
+                    first_group.setdefault(x, i)
+            for x in states.indices.tolist():
+                i = first_group.get(x)
+                if i is None:
                     groups.append([x])
+                elif groups[i] is None:
+                    groups[i] = degenerate_states[i].indices
 
         # now turn these into proper BasisStateSpace objects so we can work with them more easily
         ugh = []
@@ -1081,12 +1108,13 @@ class DegenerateMultiStateSpace(BasisMultiStateSpace):
             else:
                 ugh.append(g)
 
-        for n,x in enumerate(states.indices):
-            for g in ugh:
-                if x in g.indices:
-                    break
-            else:
+        covered = set()
+        for g in ugh:
+            covered.update(g.indices.tolist())
+        for n,x in enumerate(states.indices.tolist()):
+            if x not in covered:
                 ugh.append(states.take_subspace([n]))
+                covered.add(x)
 
         # now make a numpy array for initialization
         arrs = np.full(len(ugh), None)
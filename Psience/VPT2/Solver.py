@@ -2,7 +2,7 @@
 import numpy as np, itertools, time, types
 from collections import namedtuple
 
-from McUtils.Numputils import SparseArray
+from McUtils.Numputils import SparseArray, ScipySparseArray
 from McUtils.Scaffolding import Logger, NullLogger, NullCheckpointer
 from McUtils.Parallelizers import Parallelizer, SerialNonParallelizer
 from McUtils.Data import UnitsData
@@ -12,6 +12,7 @@ from ..BasisReps import Representation, BasisStateSpace, BasisMultiStateSpace, S
 
 from .DegeneracySpecs import DegenerateMultiStateSpace, DegeneracySpec
 from .Common import *
+from .Common import _safe_dot
 from .Corrections import *
 
 __reload_hook__ = [ "..BasisReps", ".DegeneracySpecs", ".Corrections", ".Common" ]
@@ -265,10 +266,16 @@ class PerturbationTheorySolver:
         """
         if self._zo_engs is None:
             H0 = self.representations[0]
-            e_vec_full = np.diag(H0) if isinstance(H0, np.ndarray) else H0.diag
-            if isinstance(e_vec_full, SparseArray):
-                e_vec_full = e_vec_full.asarray()
-            self._zo_engs = e_vec_full
+            if isinstance(H0, np.ndarray):
+                e_vec_full = np.diag(H0)
+            elif isinstance(H0, ScipySparseArray) and len(H0.shape) == 2:
+                # pull the diagonal straight out of the CSR data rather than fancy indexing
+                e_vec_full = H0.ascsr().diagonal()
+            else:
+                e_vec_full = H0.diag
+                if isinstance(e_vec_full, SparseArray):
+                    e_vec_full = e_vec_full.asarray()
+            self._zo_engs = np.ascontiguousarray(e_vec_full)
             if self.zero_order_energy_corrections is not None:
                 if callable(self.zero_order_energy_corrections):
                     energies = self.zero_order_energy_corrections(self.flat_total_space.excitations)
@@ -1761,24 +1768,7 @@ class PerturbationTheorySolver:
 
     PTResults = namedtuple("PTResults", ["corrections", "degeneracies"])
 
-    @staticmethod
-    def _safe_dot(a, b):
-        # generalizes the dot product so that we can use 0 as a special value...
-        if (
-                isinstance(a, (int, np.integer, float, np.floating)) and a == 0
-                or isinstance(b, (int, np.integer, float, np.floating)) and b == 0
-        ):
-            return 0
-
-        if isinstance(a, np.ndarray):
-            doots = np.dot(a, b)
-        else:
-            doots = a.dot(b)
-
-        if isinstance(b, np.ndarray) and isinstance(doots, SparseArray):
-            doots = doots.asarray()
-
-        return doots
+    _safe_dot = staticmethod(_safe_dot) # shared with the corrections so both get the CSR fast path
     def apply_VPT_equations(self,
                             state_index,
                             degenerate_space_indices,
@@ -1,4 +1,4 @@
-import abc, dataclasses, typing, numpy as np
+import abc, dataclasses, typing, concurrent.futures, numpy as np
 from McUtils.Zachary import Mesh
 
 __all__ = [
@@ -26,14 +26,16 @@ class SelfConsistentOptimizer:
     __props__ = (
         'initial_point',
         'overlap_threshold',
-        'max_iterations'
+        'max_iterations',
+        'solver_threads'
     )
     def __init__(self,
                  potential,
                  solvers_1D:'Iterable[SCFSolver]',
                  initial_point=None,
                  overlap_threshold=.999999,
-                 max_iterations=100
+                 max_iterations=100,
+                 solver_threads=None
                  ):
         self.pot = potential
         self.solv = solvers_1D
@@ -42,6 +44,7 @@ class SelfConsistentOptimizer:
         self.center = initial_point
         self.threshold = overlap_threshold
         self.its = max_iterations
+        self.solver_threads = solver_threads
     @abc.abstractmethod
     def get_initial_point(self):
         raise NotImplementedError("...")
@@ -58,12 +61,17 @@ class SelfConsistentOptimizer:
         ]
         return SelfConsistentIterationData(wfns, 0)
     def step(self, iteration_data:SelfConsistentIterationData, target:'Iterable[int]'):
-        new_wfns = [
-            solver(
+        def solve(i, solver):
+            return solver(
                 self.get_SCF_potential(i, iteration_data.wavefunctions, target)
             )
-            for i, solver in enumerate(self.solv)
-        ]
+        if self.solver_threads is not None and len(self.solv) > 1:
+            # every axis only reads the previous iteration's wavefunctions, so the 1D solves
+            # are independent and the solvers need to be thread-safe to opt into this
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.solver_threads) as pool:
+                new_wfns = list(pool.map(solve, range(len(self.solv)), self.solv))
+        else:
+            new_wfns = [solve(i, solver) for i, solver in enumerate(self.solv)]
         return SelfConsistentIterationData(new_wfns, iteration_data.iteration+1)
     def check_overlaps(self,
                        previous:SelfConsistentIterationData,
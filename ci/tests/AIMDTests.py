@@ -101,3 +101,37 @@ class AIMDTests(TestCase):
 
 
 
+
+    @validationTest
+    def test_PairwiseForces(self):
+
+        pot = PairwisePotential(lambda r: 1 / r ** 12 - 1 / r ** 6)
+
+        np.random.seed(0)
+        coords = 2 * np.random.normal(size=(7, 3))
+
+        forces = np.zeros_like(coords)
+        for i in range(len(coords)):
+            for j in range(len(coords)):
+                if i != j:
+                    d = coords[i] - coords[j]
+                    r = np.linalg.norm(d)
+                    forces[i] -= pot.deriv(r) * d / r
+
+        self.assertTrue(np.allclose(pot.forces(coords), forces))
+        self.assertTrue(np.allclose(np.sum(pot.forces(coords), axis=0), 0))
+
+    @validationTest
+    def test_PairwiseAnalyticDeriv(self):
+
+        lj_deriv = lambda r: -12 / r ** 13 + 6 / r ** 7
+        class LennardJones:
+            def __call__(self, r):
+                return 1 / r ** 12 - 1 / r ** 6
+            def deriv(self):
+                return lj_deriv
+
+        pot = PairwisePotential(LennardJones())
+
+        r = np.linspace(.9, 2.5, 10)
+        self.assertTrue(np.array_equal(pot.deriv(r), lj_deriv(r)))
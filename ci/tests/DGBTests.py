@@ -30,6 +30,19 @@ class DGBTests(TestCase):
     def setUpClass(cls) -> None:
         np.set_printoptions(linewidth=int(1e8))
 
+    @staticmethod
+    def harmonic_potential(c, deriv_order=None):
+        v = np.sum(c ** 2, axis=-1) / 2
+        if deriv_order is None:
+            return v
+        ndim = c.shape[-1]
+        derivs = [v, c]
+        if deriv_order > 1:
+            derivs.append(np.broadcast_to(np.eye(ndim), c.shape[:-1] + (ndim, ndim)))
+        for n in range(3, deriv_order + 1):
+            derivs.append(np.zeros(c.shape[:-1] + (ndim,) * n))
+        return derivs[:deriv_order + 1]
+
     @validationTest
     def test_Harmonic(self):
         ndivs = [10]*3
@@ -59,6 +72,57 @@ class DGBTests(TestCase):
             .05 # not sure why it's further off but it's still giving qualitatively correct results for now
         )
 
+    @validationTest
+    def test_NumStatesSubset(self):
+        dgb = DGB.construct(
+            np.linspace(-3, 3, 15)[:, np.newaxis],
+            self.harmonic_potential,
+            alphas=1,
+            masses=[1]
+        )
+
+        k = 4
+        for mode, opts in [
+            ('classic', {}),
+            ('classic', {'min_singular_value': 1e-6}),
+            ('fix-heiberger', {'stable_eigenvalue_epsilon': 1e-4})
+        ]:
+            eigs, evecs = dgb.diagonalize(mode=mode, nodeless_ground_state=False, **opts)
+            sub_eigs, sub_evecs = dgb.diagonalize(mode=mode, nodeless_ground_state=False, num_states=k, **opts)
+            self.assertEqual(sub_eigs.shape, (k,))
+            self.assertTrue(np.allclose(sub_eigs, eigs[:k]), msg="{}: {} != {}".format(mode, sub_eigs, eigs[:k]))
+            # eigenvectors are only defined up to a sign
+            self.assertTrue(np.allclose(np.abs(sub_evecs), np.abs(evecs[:, :k]), atol=1e-6), msg=mode)
+
+        for mode in ['similarity', 'shift', 'low-rank']:
+            with self.assertRaises(ValueError):
+                dgb.diagonalize(mode=mode, num_states=k)
+
+    @validationTest
+    def test_MinDistAlphas(self):
+        np.random.seed(0)
+        centers = np.random.uniform(-2, 2, size=(25, 2))
+        dgb = DGB.construct(
+            centers,
+            self.harmonic_potential,
+            alphas={'method': 'min_dist', 'scaling': 1 / 2},
+            masses=[1, 1]
+        )
+
+        dists = np.linalg.norm(centers[:, np.newaxis, :] - centers[np.newaxis, :, :], axis=-1)
+        np.fill_diagonal(dists, np.inf)
+        closest = np.min(dists, axis=1)
+        self.assertTrue(np.allclose(
+            dgb.gaussians.alphas,
+            1 / 2 * np.sqrt(1 / closest[:, np.newaxis]) * np.ones((1, 2))
+        ))
+
+        # exact duplicates are skipped when looking for the nearest neighbor
+        dupes = np.concatenate([centers, centers[:1]])
+        alphas = DGBGaussians.get_min_distance_alphas(dupes, masses=np.array([1, 1]))
+        self.assertTrue(np.allclose(alphas[:-1], 1 / 4 * np.sqrt(1 / closest[:, np.newaxis]) * np.ones((1, 2))))
+        self.assertTrue(np.allclose(alphas[-1], alphas[0]))
+
     @validationTest
     def test_Morse(self):
         d = 2
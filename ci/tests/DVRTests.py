@@ -57,6 +57,23 @@ class DVRTests(TestCase):
         # print(res[0][:5], file=sys.stderr)
         self.assertIsInstance(res.wavefunctions[0].data, np.ndarray)
 
+    @validationTest
+    def test_SCFThreads(self):
+        def pot(grid):
+            return self.ho_2D(grid) + .05 * grid[:, 0] ** 2 * grid[:, 1] ** 2 # coupled, so the SCF has to iterate
+
+        base_dvr = DVR(domain=[(-5, 5), (-5, 5)], divs=[35, 35], potential_function=pot, mass=[1, 1], logger=False)
+        serial_scf = SelfConsistentDVR(base_dvr)
+        threaded_scf = SelfConsistentDVR(base_dvr, solver_threads=2)
+
+        serial = serial_scf.initialize()
+        threaded = threaded_scf.initialize()
+        for _ in range(3):
+            serial = serial_scf.step(serial, [0, 0])
+            threaded = threaded_scf.step(threaded, [0, 0])
+            for s, t in zip(serial.wavefunctions, threaded.wavefunctions):
+                self.assertTrue(np.allclose(s.energies, t.energies))
+
     @validationTest
     def test_RingDVR1D(self):
         dvr_1D = RingDVR()
@@ -2445,6 +2445,73 @@ class VPT2Tests(TestCase):
 
         self.assertLess(np.max(np.abs(my_freqs - gaussian_freqs[:len(my_freqs)])), 1.5)
 
+    @validationTest
+    def test_ThreadedOperatorRepresentation(self):
+        np.random.seed(0)
+        nstates, nbasis, order = 4, 10, 3
+
+        def random_correction():
+            w = np.random.normal(size=(nstates, nbasis))
+            w[np.random.uniform(size=w.shape) < .5] = 0
+            return nput.SparseArray.from_data(w)
+        corrs = PerturbationTheoryCorrections(
+            None, None, None,
+            np.zeros((nstates, order)),
+            [random_correction() for _ in range(order)]
+        )
+
+        def random_operator():
+            A = np.random.normal(size=(nbasis, nbasis))
+            return nput.SparseArray.from_data(A + A.T)
+        def as_dense(rep):
+            return rep.asarray() if isinstance(rep, nput.SparseArray) else np.asanyarray(rep)
+
+        for expansion in [
+            [random_operator(), random_operator(), 2.],
+            [random_operator(), nput.SparseArray.from_data(np.zeros((nbasis, nbasis))), 0] # vanishing terms
+        ]:
+            for contract in [True, False]:
+                serial = corrs.operator_representation(expansion, contract=contract)
+                threaded = corrs.operator_representation(expansion, contract=contract, threads=3)
+                if not contract:
+                    serial = [t for k_terms in serial for t in k_terms]
+                    threaded = [t for k_terms in threaded for t in k_terms]
+                self.assertEqual(len(serial), len(threaded))
+                for s, t in zip(serial, threaded):
+                    self.assertEqual(np.shape(as_dense(s)), np.shape(as_dense(t)))
+                    self.assertTrue(np.allclose(as_dense(s), as_dense(t)))
+
+    @validationTest
+    def test_ReduceNTRules(self):
+        from Psience.VPT2.DegeneracySpecs import TotalQuantaDegeneracySpec
+
+        np.random.seed(0)
+        a = np.random.randint(0, 4, size=(200, 5))
+        b = np.random.randint(0, 4, size=(200, 5))
+        keep = np.logical_and(np.any(a > 0, axis=1), np.any(b > 0, axis=1))
+        a = a[keep]
+        b = b[keep]
+
+        ra, rb = TotalQuantaDegeneracySpec.reduce_rules(a, b)
+        for x, y, rx, ry in zip(a, b, ra, rb):
+            ex, ey = TotalQuantaDegeneracySpec.reduce_rule(x, y)
+            self.assertEqual((tuple(rx), tuple(ry)), (tuple(ex), tuple(ey)))
+
+        rules = TotalQuantaDegeneracySpec.make_nt_polyad([2, 1, 1], max_quanta=4)
+        states = BasisStateSpace.from_quanta(
+            HarmonicOscillatorProductBasis(3),
+            list(range(1, 4 + 1))
+        ).excitations
+        nts = np.dot(states, [2, 1, 1])
+        (keys, groups), _ = nput.group_by(states, nts)
+        expected = set()
+        for k, g in zip(keys, groups):
+            if k > 0 and len(g) > 1:
+                for i, j in zip(*np.triu_indices(len(g), k=1)):
+                    x, y = TotalQuantaDegeneracySpec.reduce_rule(g[i], g[j])
+                    expected.add((tuple(x.tolist()), tuple(y.tolist())))
+        self.assertEqual(set(rules), expected)
+
     #endregion
 
     #region Test Systems